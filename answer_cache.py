@@ -0,0 +1,146 @@
+"""
+Semantic answer cache for /query
+A query whose embedding is within SIMILARITY_THRESHOLD (cosine) of a
+previously answered one gets the stored answer back without retrieval
+or an LLM call, but only if both name exactly the same pages and
+value+unit pairs ("page 211" never matches "page 212", "5.5 mm" never
+matches "6 mm"). Entries expire by TTL, are evicted LRU, and the whole
+cache is dropped when the vector store changes.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+from model_registry import get_embeddings
+from lexical_index import extract_unit_values
+from retrivel import extract_page_numbers
+from loadingandcleaning.vector_store_builder import store_generation
+
+# ================= CONFIG =================
+SIMILARITY_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "500"))
+ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+
+
+# ================= HELPERS =================
+def query_constraints(query: str) -> tuple:
+    """Exact references a cached answer must share: (pages, (value, unit) pairs)."""
+    return (
+        tuple(sorted(extract_page_numbers(query))),
+        tuple(sorted(set(extract_unit_values(query)))),
+    )
+
+
+# ================= CACHE =================
+class SemanticAnswerCache:
+
+    def __init__(
+        self,
+        persist_dir: str,
+        threshold: float = SIMILARITY_THRESHOLD,
+        ttl_seconds: float = TTL_SECONDS,
+        max_entries: int = MAX_ENTRIES,
+    ):
+        self.persist_dir = persist_dir
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        self.entries: "OrderedDict[str, dict]" = OrderedDict()
+        self.generation = store_generation(persist_dir)
+        self.metrics = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+        }
+        self.lock = threading.Lock()
+
+    # ---------- helpers ----------
+    @staticmethod
+    def _embed(query: str) -> np.ndarray:
+        vector = np.asarray(get_embeddings().embed_query(query), dtype=np.float32)
+        return vector / max(np.linalg.norm(vector), 1e-12)
+
+    def _check_generation(self):
+        """Drop everything if documents were added/removed since caching."""
+        generation = store_generation(self.persist_dir)
+        if generation != self.generation:
+            if self.entries:
+                self.metrics["invalidations"] += 1
+            self.entries.clear()
+            self.generation = generation
+
+    def _expire(self):
+        now = time.time()
+        expired = [
+            key for key, entry in self.entries.items()
+            if now - entry["created_at"] > self.ttl_seconds
+        ]
+        for key in expired:
+            del self.entries[key]
+        self.metrics["expirations"] += len(expired)
+
+    # ---------- API ----------
+    def get(self, query: str) -> Optional[dict]:
+        vector = self._embed(query)
+        constraints = query_constraints(query)
+
+        with self.lock:
+            self._check_generation()
+            self._expire()
+
+            keys = [
+                key for key, entry in self.entries.items()
+                if entry["constraints"] == constraints
+            ]
+
+            if keys:
+                matrix = np.vstack([self.entries[k]["vector"] for k in keys])
+                sims = matrix @ vector
+                best = int(np.argmax(sims))
+
+                if sims[best] >= self.threshold:
+                    key = keys[best]
+                    self.entries.move_to_end(key)
+                    self.metrics["hits"] += 1
+                    print(f"💾 answer cache hit ({sims[best]:.3f}) for: {key}")
+                    return dict(self.entries[key]["answer"])
+
+            self.metrics["misses"] += 1
+            return None
+
+    def put(self, query: str, answer: dict):
+        vector = self._embed(query)
+
+        with self.lock:
+            self._check_generation()
+
+            self.entries[query] = {
+                "vector": vector,
+                "constraints": query_constraints(query),
+                "answer": dict(answer),
+                "created_at": time.time(),
+            }
+            self.entries.move_to_end(query)
+
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.metrics["evictions"] += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.metrics["hits"] + self.metrics["misses"]
+            return {
+                **self.metrics,
+                "hit_rate": self.metrics["hits"] / lookups if lookups else 0.0,
+                "entries": len(self.entries),
+                "threshold": self.threshold,
+            }
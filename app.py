@@ -1,13 +1,21 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
-from output import answer_query 
+from output import answer_query, stream_answer_query, get_llm, answer_cache
+import json
+import re
 import uuid
 from werkzeug.utils import secure_filename
 import os
-from loadingandcleaning.run_ingestion_pipeline import run_pipeline
+from ingestion_jobs import submit_ingestion_job, get_job, QueueFullError
+from model_registry import warmup, startup_report, embedding_cache_stats
+from query_router import route_stats
 UPLOAD_ROOT = "uploaded_files"
 os.makedirs(UPLOAD_ROOT, exist_ok=True)
 
+# optional client-chosen document id (same id → a revised manual replaces
+# the previous version); ":" is reserved for chunk ids
+DOCUMENT_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,128}$")
+
 # <-- answer_query returns dict now
 
 
@@ -17,6 +25,10 @@ os.makedirs(UPLOAD_ROOT, exist_ok=True)
 app = Flask(__name__)
 CORS(app)  # allow frontend (Next.js) calls
 
+# load models now instead of on the first request
+if os.getenv("WARMUP_ON_START", "0") == "1":
+    print("warmup", warmup(get_llm))
+
 
 # ===============================
 # Health Check
@@ -26,6 +38,19 @@ def health():
     return jsonify({"status": "ok"}), 200
 
 
+# ===============================
+# Metrics
+# ===============================
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return jsonify({
+        "models": startup_report(),
+        "embeddings": embedding_cache_stats(),
+        "answer_cache": answer_cache.stats(),
+        "routing": route_stats(),
+    }), 200
+
+
 # ===============================
 # Main RAG Endpoint
 # ===============================
@@ -37,10 +62,13 @@ def query():
         return jsonify({"error": "query field is required"}), 400
 
     query_text = data["query"]
+    # client-supplied conversation id → history shared across workers;
+    # none → a single history-free turn
+    session_id = str(data["session_id"]) if data.get("session_id") else None
 
     try:
         # 🔑 Single function call
-        result = answer_query(query_text)
+        result = answer_query(query_text, session_id)
 
         print("result" ,result)
 
@@ -67,6 +95,46 @@ def query():
             "message": str(e)
         }), 500
 
+# ===============================
+# Streaming RAG Endpoint (Server-Sent Events)
+# ===============================
+def sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route("/query/stream", methods=["POST"])
+def query_stream():
+    data = request.get_json(silent=True)
+
+    if not data or "query" not in data:
+        return jsonify({"error": "query field is required"}), 400
+
+    query_text = data["query"]
+    # client-supplied conversation id → history shared across workers;
+    # none → a single history-free turn
+    session_id = str(data["session_id"]) if data.get("session_id") else None
+
+    def generate():
+        try:
+            for event, payload in stream_answer_query(query_text, session_id):
+                yield sse(event, payload)
+        except Exception as e:
+            print("error in stream",e)
+            yield sse("error", {
+                "error": "internal_server_error",
+                "message": str(e)
+            })
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",   # don't let a proxy buffer the stream
+        },
+    )
+
+
 @app.route("/upload", methods=["POST"])
 def upload_file():
     if "file" not in request.files:
@@ -77,6 +145,10 @@ def upload_file():
     if file.filename == "":
         return jsonify({"error": "No selected file"}), 400
 
+    document_id = request.form.get("document_id") or None
+    if document_id is not None and not DOCUMENT_ID_PATTERN.match(document_id):
+        return jsonify({"error": "document_id may only contain letters, digits, '.', '_' and '-'"}), 400
+
     # 🔹 Create a unique folder for EACH upload
     folder_id = str(uuid.uuid4())
     save_dir = os.path.join(UPLOAD_ROOT, folder_id)
@@ -90,26 +162,42 @@ def upload_file():
     print("file-path",file_path)
 
     try:
-        ingestion_result = run_pipeline(
-            save_dir,   # ✅ pass generated folder
+        job_id = submit_ingestion_job(
+            file_path,  # ✅ pass the uploaded PDF itself
             0,
-            2         # ingest full document
+            None,       # ingest full document
+            meta={"folder": folder_id, "filename": filename, "document_id": document_id},
+            document_id=document_id,
         )
-    except Exception as e:
-        print('error in injestion',e)
+    except QueueFullError as e:
+        print('ingestion queue full',e)
         return jsonify({
-            "message": "File uploaded but ingestion failed",
+            "message": "File uploaded but ingestion queue is full",
             "folder": folder_id,
             "filename": filename,
             "error": str(e)
-        }), 500
+        }), 503
 
     return jsonify({
-        "message": "File uploaded successfully",
+        "message": "File uploaded, ingestion queued",
+        "job_id": job_id,
         "folder": folder_id,
         "filename": filename,
         "path": file_path
-    }), 200
+    }), 202
+
+
+# ===============================
+# Ingestion Job Status
+# ===============================
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    job = get_job(job_id)
+
+    if job is None:
+        return jsonify({"error": "job not found"}), 404
+
+    return jsonify(job), 200
 
 # ===============================
 # Run Server
@@ -0,0 +1,407 @@
+"""
+Token-budgeted conversation history
+Keeps the most recent turns verbatim within a token budget and folds
+older turns into a rolling summary. Storage is pluggable:
+- memory: per-process dict, evicted LRU / by TTL
+- sqlite: one WAL-mode file shared by every gunicorn worker
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Sequence, Tuple
+
+from dotenv import load_dotenv
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import (
+    BaseMessage,
+    HumanMessage,
+    SystemMessage,
+    messages_from_dict,
+    messages_to_dict,
+)
+
+load_dotenv()
+
+# ================= CONFIG =================
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))   # verbatim turns
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "6"))
+# once over the limits, fold down to this share of them → the summarizer
+# runs every few turns instead of on every turn
+HISTORY_LOW_WATER = float(os.getenv("HISTORY_LOW_WATER", "0.5"))
+SUMMARY_MAX_CHARS = 2000                                                # fallback cap
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "3600"))
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "1000"))
+
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")                # memory | sqlite
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "./sessions.sqlite3")
+PURGE_INTERVAL_SECONDS = 60
+
+# (previous summary, messages to fold in) → new summary
+Summarizer = Callable[[str, List[BaseMessage]], str]
+
+# (seq, message) – seq increases per session, in insertion order
+SeqMessage = Tuple[int, BaseMessage]
+
+
+# ================= HELPERS =================
+def estimate_tokens(messages: Sequence[BaseMessage]) -> int:
+    """~4 chars per token plus a little per-message overhead."""
+    return sum(len(str(m.content)) // 4 + 4 for m in messages)
+
+
+def split_turns(messages: List[SeqMessage]) -> List[List[SeqMessage]]:
+    """Group messages into turns, each starting at a HumanMessage."""
+    turns = []
+    for seq, message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([(seq, message)])
+        else:
+            turns[-1].append((seq, message))
+    return turns
+
+
+def fallback_summary(summary: str, messages: List[BaseMessage]) -> str:
+    """Used when the summarizer LLM fails: keep the tail of a plain transcript."""
+    lines = [summary] if summary else []
+    lines += [f"{m.type}: {m.content}" for m in messages]
+    return "\n".join(lines)[-SUMMARY_MAX_CHARS:]
+
+
+# ================= BACKENDS =================
+class InMemoryHistoryBackend:
+    """Process-local sessions, evicted by TTL and LRU."""
+
+    def __init__(self, ttl_seconds: float = SESSION_TTL_SECONDS, max_sessions: int = MAX_SESSIONS):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        # id → {"summary", "folded_seq", "messages": [(seq, msg)], "last_used"}
+        self.sessions: "OrderedDict[str, dict]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _evict(self, now: float):
+        # oldest first (LRU order) → stop at the first live session
+        while self.sessions:
+            sid, session = next(iter(self.sessions.items()))
+            if now - session["last_used"] <= self.ttl_seconds:
+                break
+            del self.sessions[sid]
+
+        while len(self.sessions) > self.max_sessions:
+            self.sessions.popitem(last=False)
+
+    def _session(self, session_id: str) -> dict:
+        now = time.time()
+        self._evict(now)
+
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = {"summary": "", "folded_seq": 0, "messages": [], "last_used": now}
+            self.sessions[session_id] = session
+
+        session["last_used"] = now
+        self.sessions.move_to_end(session_id)
+        return session
+
+    def load(self, session_id: str, tail: int) -> Tuple[str, int, List[SeqMessage]]:
+        with self.lock:
+            session = self._session(session_id)
+            return session["summary"], session["folded_seq"], list(session["messages"][-tail:])
+
+    def has_history(self, session_id: str) -> bool:
+        """Plain read: creates no session and does not refresh its TTL."""
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is None or time.time() - session["last_used"] > self.ttl_seconds:
+                return False
+            return bool(session["summary"] or session["messages"])
+
+    def append(self, session_id: str, messages: Sequence[BaseMessage]):
+        with self.lock:
+            session = self._session(session_id)
+            seq = session["messages"][-1][0] if session["messages"] else session["folded_seq"]
+            for message in messages:
+                seq += 1
+                session["messages"].append((seq, message))
+
+    def fold(self, session_id: str, expected_folded_seq: int, upto_seq: int, summary: str) -> bool:
+        with self.lock:
+            session = self._session(session_id)
+            if session["folded_seq"] != expected_folded_seq:
+                return False
+
+            session["summary"] = summary
+            session["folded_seq"] = upto_seq
+            session["messages"] = [(s, m) for s, m in session["messages"] if s > upto_seq]
+            return True
+
+    def clear(self, session_id: str):
+        with self.lock:
+            self.sessions.pop(session_id, None)
+
+    def session_count(self) -> int:
+        return len(self.sessions)
+
+
+class SQLiteHistoryBackend:
+    """
+    Sessions in one SQLite file (WAL mode) so every worker process sees
+    the same conversations. Only the unfolded tail is ever loaded.
+    """
+
+    def __init__(
+        self,
+        path: str = SESSION_DB_PATH,
+        ttl_seconds: float = SESSION_TTL_SECONDS,
+        max_sessions: int = MAX_SESSIONS,
+    ):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.last_purge = 0.0
+        self.lock = threading.Lock()
+
+        self.conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                summary TEXT NOT NULL DEFAULT '',
+                folded_seq INTEGER NOT NULL DEFAULT 0,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_sessions_last_used ON sessions(last_used);
+            CREATE TABLE IF NOT EXISTS messages (
+                session_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                message TEXT NOT NULL,
+                PRIMARY KEY (session_id, seq)
+            ) WITHOUT ROWID;
+            """
+        )
+
+    def _touch(self, session_id: str):
+        now = time.time()
+        self.conn.execute(
+            "INSERT INTO sessions (session_id, last_used) VALUES (?, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET last_used = excluded.last_used",
+            (session_id, now)
+        )
+
+        if now - self.last_purge > PURGE_INTERVAL_SECONDS:
+            self.last_purge = now
+            self._purge(now)
+
+    def _purge(self, now: float):
+        """Drop idle sessions (TTL), then the least recently used beyond max_sessions."""
+        stale = [
+            sid for (sid,) in self.conn.execute(
+                "SELECT session_id FROM sessions WHERE last_used < ?",
+                (now - self.ttl_seconds,)
+            )
+        ]
+        stale += [
+            sid for (sid,) in self.conn.execute(
+                "SELECT session_id FROM sessions WHERE last_used >= ? "
+                "ORDER BY last_used DESC LIMIT -1 OFFSET ?",
+                (now - self.ttl_seconds, self.max_sessions)
+            )
+        ]
+        for sid in stale:
+            self.conn.execute("DELETE FROM messages WHERE session_id = ?", (sid,))
+            self.conn.execute("DELETE FROM sessions WHERE session_id = ?", (sid,))
+
+    def load(self, session_id: str, tail: int) -> Tuple[str, int, List[SeqMessage]]:
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._touch(session_id)
+                summary, folded_seq = self.conn.execute(
+                    "SELECT summary, folded_seq FROM sessions WHERE session_id = ?",
+                    (session_id,)
+                ).fetchone()
+                rows = self.conn.execute(
+                    "SELECT seq, message FROM messages WHERE session_id = ? AND seq > ? "
+                    "ORDER BY seq DESC LIMIT ?",
+                    (session_id, folded_seq, tail)
+                ).fetchall()
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+        rows.reverse()
+        messages = messages_from_dict([json.loads(m) for _, m in rows])
+        return summary, folded_seq, [(seq, msg) for (seq, _), msg in zip(rows, messages)]
+
+    def has_history(self, session_id: str) -> bool:
+        """Plain read: creates no session and does not refresh its TTL."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT summary != '' OR EXISTS ("
+                "SELECT 1 FROM messages m WHERE m.session_id = s.session_id AND m.seq > s.folded_seq) "
+                "FROM sessions s WHERE s.session_id = ? AND s.last_used >= ?",
+                (session_id, time.time() - self.ttl_seconds)
+            ).fetchone()
+        return bool(row and row[0])
+
+    def append(self, session_id: str, messages: Sequence[BaseMessage]):
+        payloads = [json.dumps(m) for m in messages_to_dict(list(messages))]
+
+        with self.lock:
+            # IMMEDIATE → seq allocation is serialized across processes
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._touch(session_id)
+                (seq,) = self.conn.execute(
+                    "SELECT MAX(COALESCE((SELECT MAX(seq) FROM messages WHERE session_id = ?), 0), folded_seq) "
+                    "FROM sessions WHERE session_id = ?",
+                    (session_id, session_id)
+                ).fetchone()
+                self.conn.executemany(
+                    "INSERT INTO messages (session_id, seq, message) VALUES (?, ?, ?)",
+                    [(session_id, seq + i + 1, payload) for i, payload in enumerate(payloads)]
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def fold(self, session_id: str, expected_folded_seq: int, upto_seq: int, summary: str) -> bool:
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                # compare-and-set: another worker may have folded first
+                updated = self.conn.execute(
+                    "UPDATE sessions SET summary = ?, folded_seq = ? "
+                    "WHERE session_id = ? AND folded_seq = ?",
+                    (summary, upto_seq, session_id, expected_folded_seq)
+                ).rowcount
+                if updated:
+                    self.conn.execute(
+                        "DELETE FROM messages WHERE session_id = ? AND seq <= ?",
+                        (session_id, upto_seq)
+                    )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+        return bool(updated)
+
+    def clear(self, session_id: str):
+        with self.lock:
+            self.conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self.conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def session_count(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+def make_history_backend(kind: str = SESSION_BACKEND):
+    if kind == "sqlite":
+        return SQLiteHistoryBackend()
+    if kind == "memory":
+        return InMemoryHistoryBackend()
+    raise ValueError(f"Unknown SESSION_BACKEND: {kind}")
+
+
+# ================= HISTORY =================
+class BudgetedChatHistory(BaseChatMessageHistory):
+    """
+    messages = [rolling summary as SystemMessage] + recent turns.
+    When the recent turns exceed max_turns or token_budget, the oldest
+    turns are folded into the summary until they fit low_water of both.
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        backend,
+        summarizer: Summarizer,
+        token_budget: int = HISTORY_TOKEN_BUDGET,
+        max_turns: int = HISTORY_MAX_TURNS,
+        low_water: float = HISTORY_LOW_WATER,
+    ):
+        self.session_id = session_id
+        self.backend = backend
+        self.summarizer = summarizer
+        self.token_budget = token_budget
+        self.max_turns = max_turns
+        self.low_water = low_water
+
+    @property
+    def tail(self) -> int:
+        # enough for max_turns plus a turn or two appended before folding
+        return (self.max_turns + 2) * 2
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        summary, _, recent = self.backend.load(self.session_id, self.tail)
+        recent = [m for _, m in recent]
+
+        if not summary:
+            return recent
+        return [
+            SystemMessage(content=f"Summary of the earlier conversation:\n{summary}")
+        ] + recent
+
+    def has_history(self) -> bool:
+        return self.backend.has_history(self.session_id)
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        self.backend.append(self.session_id, messages)
+        self._enforce_budget()
+
+    def clear(self) -> None:
+        self.backend.clear(self.session_id)
+
+    def _enforce_budget(self):
+        summary, folded_seq, recent = self.backend.load(self.session_id, self.tail)
+        turns = split_turns(recent)
+
+        def over(max_turns, token_budget):
+            return len(turns) > max_turns or (
+                estimate_tokens([m for turn in turns for _, m in turn]) > token_budget
+            )
+
+        if len(turns) <= 1 or not over(self.max_turns, self.token_budget):
+            return
+
+        # fold down to the low-water mark, always keeping the newest turn verbatim
+        low_turns = max(int(self.max_turns * self.low_water), 1)
+        low_tokens = int(self.token_budget * self.low_water)
+        folded: List[SeqMessage] = []
+
+        while len(turns) > 1 and over(low_turns, low_tokens):
+            folded.extend(turns.pop(0))
+
+        folded_messages = [m for _, m in folded]
+        try:
+            new_summary = self.summarizer(summary, folded_messages).strip()
+        except Exception as e:
+            print("⚠️ History summarization failed:", e)
+            new_summary = fallback_summary(summary, folded_messages)
+
+        self.backend.fold(self.session_id, folded_seq, folded[-1][0], new_summary)
+
+
+# ================= SESSION STORE =================
+class SessionStore:
+    """session_id → BudgetedChatHistory view over the configured backend."""
+
+    def __init__(self, summarizer: Summarizer, backend=None):
+        self.summarizer = summarizer
+        self.backend = backend or make_history_backend()
+
+    def get(self, session_id: str) -> BudgetedChatHistory:
+        return BudgetedChatHistory(session_id, self.backend, self.summarizer)
+
+    def __len__(self) -> int:
+        return self.backend.session_count()
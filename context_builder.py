@@ -0,0 +1,152 @@
+"""
+Token-budgeted context builder
+Retrieved pages are split into sentences, every sentence is scored
+against the query embedding in one vectorized batch, and the best ones
+are kept (with their page) until the token budget is spent.
+No extra LLM call.
+Explicit page lookups are not compressed but truncated to their own
+budget, with a note naming the pages left out.
+"""
+
+import os
+import re
+from typing import List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from model_registry import get_embeddings
+
+# ================= CONFIG =================
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))   # 0 → no compression
+# explicit page lookups are sent verbatim, in reading order, up to this
+PAGE_CONTEXT_TOKEN_BUDGET = int(os.getenv("PAGE_CONTEXT_TOKEN_BUDGET", "3000"))
+MIN_SENTENCE_CHARS = 3
+
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?;])\s+|\n+")
+
+
+# ================= HELPERS =================
+def estimate_tokens(text: str) -> int:
+    """~4 chars per token."""
+    return len(text) // 4 + 1
+
+
+def split_sentences(text: str) -> List[str]:
+    return [
+        s.strip() for s in SENTENCE_SPLIT.split(text)
+        if len(s.strip()) >= MIN_SENTENCE_CHARS
+    ]
+
+
+def format_pages(parts: List[Tuple[object, str]]) -> str:
+    """[(page, text)] → "(Page N) text" blocks, same format as build_context."""
+    return "\n\n".join(f"(Page {page}) {text}" for page, text in parts)
+
+
+# ================= PUBLIC API =================
+def build_compressed_context(
+    query: str,
+    docs: List[Document],
+    token_budget: int = CONTEXT_TOKEN_BUDGET,
+) -> str:
+    full = format_pages([(d.metadata.get("page"), d.page_content) for d in docs])
+
+    if token_budget <= 0 or estimate_tokens(full) <= token_budget:
+        return full
+
+    # (doc index, sentence index, sentence)
+    sentences = [
+        (doc_idx, sent_idx, sentence)
+        for doc_idx, doc in enumerate(docs)
+        for sent_idx, sentence in enumerate(split_sentences(doc.page_content))
+    ]
+    if not sentences:
+        return full
+
+    embeddings = get_embeddings()
+    query_vec = np.asarray(embeddings.embed_query(query), dtype=np.float32)
+    sent_vecs = np.asarray(
+        embeddings.embed_documents([s for _, _, s in sentences]),
+        dtype=np.float32,
+    )
+
+    norms = np.linalg.norm(sent_vecs, axis=1) * max(np.linalg.norm(query_vec), 1e-12)
+    scores = (sent_vecs @ query_vec) / np.maximum(norms, 1e-12)
+
+    # greedily take the best sentences that still fit
+    kept = set()
+    used = 0
+    for i in np.argsort(-scores):
+        cost = estimate_tokens(sentences[i][2])
+        if used + cost > token_budget:
+            continue
+        kept.add(int(i))
+        used += cost
+
+    # no sentence fits on its own: the best one, cut to the budget
+    if not kept:
+        best = int(np.argmax(scores))
+        doc_idx, sent_idx, sentence = sentences[best]
+        sentences[best] = (doc_idx, sent_idx, sentence[: max(token_budget - 1, 1) * 4] + " …")
+        kept.add(best)
+
+    # back to reading order, grouped per retrieved page
+    grouped = {}
+    for i, (doc_idx, _, sentence) in enumerate(sentences):
+        if i in kept:
+            grouped.setdefault(doc_idx, []).append(sentence)
+
+    parts = [
+        (docs[doc_idx].metadata.get("page"), " ".join(grouped[doc_idx]))
+        for doc_idx in sorted(grouped)
+    ]
+
+    context = format_pages(parts)
+    print(f"✂️ Context compressed {estimate_tokens(full)} → {estimate_tokens(context)} tokens")
+    return context
+
+
+def build_page_context(
+    docs: List[Document],
+    requested_pages: Optional[List[int]] = None,
+    token_budget: int = PAGE_CONTEXT_TOKEN_BUDGET,
+) -> str:
+    """
+    Chunks of an explicit page lookup, verbatim and in reading order,
+    until token_budget is spent (the chunk crossing it is cut). A note
+    names requested pages that are missing or cut, so the model does not
+    answer as if it had seen them.
+    """
+    parts = []
+    used = 0
+    cut_page = None
+
+    for doc in docs:
+        page = doc.metadata.get("page")
+        cost = estimate_tokens(doc.page_content)
+
+        if used + cost > token_budget:
+            room = (token_budget - used) * 4
+            if room > 0:
+                parts.append((page, doc.page_content[:room] + " …"))
+            cut_page = page
+            break
+
+        parts.append((page, doc.page_content))
+        used += cost
+
+    shown = {page for page, _ in parts}
+    missing = [p for p in (requested_pages or []) if p not in shown]
+
+    notes = []
+    if cut_page is not None:
+        notes.append(f"page {cut_page} is cut off")
+    if missing:
+        notes.append("pages not included: " + ", ".join(str(p) for p in missing))
+
+    context = format_pages(parts)
+    if notes:
+        print(f"✂️ Page context truncated ({'; '.join(notes)})")
+        context += f"\n\n(Note: not all requested text is shown; {'; '.join(notes)}.)"
+    return context
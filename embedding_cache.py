@@ -0,0 +1,214 @@
+"""
+Cache-backed embeddings
+Wraps any LangChain Embeddings with an in-process LRU tier and an
+on-disk SQLite tier (vectors stored as float32 blobs).
+key = sha256(model name, whitespace-normalized text)
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# ================= CONFIG =================
+CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.sqlite3")
+MEMORY_ITEMS = int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", "10000"))
+MAX_DISK_BYTES = int(float(os.getenv("EMBEDDING_CACHE_MAX_MB", "256")) * 1024 * 1024)
+
+
+# ================= HELPERS =================
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+def embedding_key(model_name: str, text: str) -> str:
+    h = hashlib.sha256()
+    h.update(model_name.encode("utf-8"))
+    h.update(b"\0")
+    h.update(normalize_text(text).encode("utf-8"))
+    return h.hexdigest()
+
+
+# ================= CACHE =================
+class CachedEmbeddings(Embeddings):
+    """
+    Drop-in Embeddings wrapper.
+    Lookup order: memory LRU → disk → underlying model (misses batched).
+    """
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        model_name: str,
+        path: str = CACHE_PATH,
+        memory_items: int = MEMORY_ITEMS,
+        max_disk_bytes: int = MAX_DISK_BYTES,
+    ):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.memory_items = memory_items
+        self.max_disk_bytes = max_disk_bytes
+
+        self.memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.metrics = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+        }
+        self.lock = threading.Lock()
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        # WAL → ingestion writes don't block query-time reads
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)"
+        )
+        self.conn.commit()
+
+        self.disk_bytes = self.conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+        ).fetchone()[0]
+
+    # ---------- memory tier ----------
+    def _memory_get(self, key: str) -> Optional[np.ndarray]:
+        vector = self.memory.get(key)
+        if vector is not None:
+            self.memory.move_to_end(key)
+        return vector
+
+    def _memory_put(self, key: str, vector: np.ndarray):
+        self.memory[key] = vector
+        self.memory.move_to_end(key)
+
+        while len(self.memory) > self.memory_items:
+            self.memory.popitem(last=False)
+            self.metrics["memory_evictions"] += 1
+
+    # ---------- disk tier ----------
+    def _disk_get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        if not keys:
+            return found
+
+        # stay under SQLite's bound-parameter limit
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            rows = self.conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                chunk
+            ).fetchall()
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32)
+
+        if found:
+            now = time.time()
+            self.conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                [(now, key) for key in found]
+            )
+            self.conn.commit()
+
+        return found
+
+    def _disk_put_many(self, items: Dict[str, np.ndarray]):
+        now = time.time()
+        for key, vector in items.items():
+            blob = vector.astype(np.float32).tobytes()
+            old = self.conn.execute(
+                "SELECT LENGTH(vector) FROM embeddings WHERE key = ?", (key,)
+            ).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                (key, blob, now)
+            )
+            self.disk_bytes += len(blob) - (old[0] if old else 0)
+
+        while self.disk_bytes > self.max_disk_bytes:
+            row = self.conn.execute(
+                "SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_used LIMIT 1"
+            ).fetchone()
+            if row is None:
+                break
+            self.conn.execute("DELETE FROM embeddings WHERE key = ?", (row[0],))
+            self.disk_bytes -= row[1]
+            self.metrics["disk_evictions"] += 1
+
+        self.conn.commit()
+
+    # ---------- Embeddings API ----------
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [embedding_key(self.model_name, t) for t in texts]
+        vectors: Dict[str, np.ndarray] = {}
+
+        with self.lock:
+            for key in keys:
+                vector = self._memory_get(key)
+                if vector is not None:
+                    vectors[key] = vector
+
+            self.metrics["memory_hits"] += len(vectors)
+
+            disk_keys = list({k for k in keys if k not in vectors})
+            from_disk = self._disk_get_many(disk_keys)
+            self.metrics["disk_hits"] += len(from_disk)
+            for key, vector in from_disk.items():
+                self._memory_put(key, vector)
+            vectors.update(from_disk)
+
+        # embed each missing text once, outside the lock
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors and key not in missing:
+                missing[key] = text
+
+        if missing:
+            embedded = self.underlying.embed_documents(list(missing.values()))
+            new_vectors = {
+                key: np.asarray(vector, dtype=np.float32)
+                for key, vector in zip(missing, embedded)
+            }
+
+            with self.lock:
+                self.metrics["misses"] += len(new_vectors)
+                for key, vector in new_vectors.items():
+                    self._memory_put(key, vector)
+                self._disk_put_many(new_vectors)
+
+            vectors.update(new_vectors)
+
+        return [vectors[key].tolist() for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = (
+                self.metrics["memory_hits"]
+                + self.metrics["disk_hits"]
+                + self.metrics["misses"]
+            )
+            return {
+                **self.metrics,
+                "hit_rate": (lookups - self.metrics["misses"]) / lookups if lookups else 0.0,
+                "memory_items": len(self.memory),
+                "disk_bytes": self.disk_bytes,
+                "max_disk_bytes": self.max_disk_bytes,
+            }
@@ -0,0 +1,264 @@
+"""
+Background ingestion jobs
+Uploads are queued onto a bounded local worker pool so the HTTP worker
+returns immediately and /query keeps its threads.
+Job records live in one WAL-mode SQLite file shared by every gunicorn
+worker, so /jobs/<id> answers no matter which worker took the upload.
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from loadingandcleaning.run_ingestion_pipeline import (
+    STREAMING,
+    run_pipeline,
+    run_pipeline_streaming,
+)
+
+load_dotenv()
+
+# ================= CONFIG =================
+MAX_CONCURRENT_JOBS = int(os.getenv("INGEST_MAX_CONCURRENT_JOBS", "1"))
+MAX_QUEUED_JOBS = int(os.getenv("INGEST_MAX_QUEUED_JOBS", "16"))        # across all workers
+JOBS_DB_PATH = os.getenv("INGEST_JOBS_DB_PATH", "./ingestion_jobs.sqlite3")
+FINISHED_JOBS_TO_KEEP = 100
+
+HOSTNAME = socket.gethostname()
+
+
+class QueueFullError(Exception):
+    """Raised when too many ingestion jobs are already waiting."""
+
+
+# ================= HELPERS =================
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# ================= STORE =================
+class JobStore:
+    """
+    jobs(id, status, owner_host, owner_pid, meta, progress, result, error,
+         created_at, started_at, finished_at); JSON columns for the dicts.
+    A queued / running job whose owning process is gone (same host) is
+    marked failed, so a restarted worker does not leave jobs hanging.
+    """
+
+    JSON_FIELDS = ("meta", "progress", "result")
+
+    def __init__(self, path: str = JOBS_DB_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+
+        self.conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                owner_host TEXT NOT NULL,
+                owner_pid INTEGER NOT NULL,
+                meta TEXT NOT NULL,
+                progress TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status);
+            """
+        )
+
+    def _row_to_job(self, columns, row) -> dict:
+        job = dict(zip(columns, row))
+        del job["owner_host"], job["owner_pid"]
+        for field in self.JSON_FIELDS:
+            job[field] = json.loads(job[field]) if job[field] is not None else None
+        return job
+
+    def _fail_orphans(self):
+        """Pending jobs of dead processes on this host → failed."""
+        for job_id, pid in self.conn.execute(
+            "SELECT id, owner_pid FROM jobs WHERE status IN ('queued', 'running') AND owner_host = ?",
+            (HOSTNAME,)
+        ).fetchall():
+            if not _process_alive(pid):
+                self.conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                    ("worker process exited before the job finished", time.time(), job_id)
+                )
+
+    def create(self, job: dict, max_pending: int):
+        """Insert a queued job; raises QueueFullError when max_pending are pending."""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._fail_orphans()
+                (pending,) = self.conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')"
+                ).fetchone()
+                if pending >= max_pending:
+                    raise QueueFullError(f"{max_pending} ingestion jobs already pending")
+
+                # keep only the newest FINISHED_JOBS_TO_KEEP finished jobs
+                self.conn.execute(
+                    "DELETE FROM jobs WHERE id IN ("
+                    "SELECT id FROM jobs WHERE status IN ('done', 'failed') "
+                    "ORDER BY finished_at DESC LIMIT -1 OFFSET ?)",
+                    (FINISHED_JOBS_TO_KEEP,)
+                )
+
+                row = {
+                    **job,
+                    **{f: json.dumps(job[f]) if job[f] is not None else None for f in self.JSON_FIELDS},
+                }
+                self.conn.execute(
+                    f"INSERT INTO jobs ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+                    list(row.values())
+                )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def update(self, job_id: str, **fields):
+        for field in self.JSON_FIELDS:
+            if field in fields and fields[field] is not None:
+                fields[field] = json.dumps(fields[field])
+
+        with self.lock:
+            self.conn.execute(
+                f"UPDATE jobs SET {', '.join(f'{f} = ?' for f in fields)} WHERE id = ?",
+                [*fields.values(), job_id]
+            )
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self.lock:
+            self._fail_orphans()
+            cursor = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+            row = cursor.fetchone()
+        return self._row_to_job([c[0] for c in cursor.description], row) if row else None
+
+
+# ================= STATE =================
+_executor = ThreadPoolExecutor(
+    max_workers=MAX_CONCURRENT_JOBS,
+    thread_name_prefix="ingest"
+)
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_job_store() -> JobStore:
+    # opened on first use → importing this module does not touch the disk
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = JobStore()
+        return _store
+
+
+def _progress_callback(job_id: str, progress: dict):
+    lock = threading.Lock()
+
+    def report(stage: str, pages_done: int):
+        with lock:
+            progress[stage] = pages_done
+            get_job_store().update(job_id, progress=progress)
+    return report
+
+
+def _run_job(
+    job_id: str,
+    pdf_path: str,
+    start_page: int,
+    end_page: Optional[int],
+    document_id: Optional[str],
+    progress: dict,
+):
+    store = get_job_store()
+    store.update(job_id, status="running", started_at=time.time())
+    print(f"🚚 Ingestion job {job_id} started")
+
+    pipeline = run_pipeline_streaming if STREAMING else run_pipeline
+
+    try:
+        pipeline(
+            pdf_path,
+            start_page,
+            end_page,
+            progress=_progress_callback(job_id, progress),
+            document_id=document_id,
+        )
+    except Exception as e:
+        print(f"❌ Ingestion job {job_id} failed:", e)
+        store.update(job_id, status="failed", error=str(e), finished_at=time.time())
+        return
+
+    store.update(job_id, status="done", result=dict(progress), finished_at=time.time())
+    print(f"✅ Ingestion job {job_id} finished")
+
+
+# ================= PUBLIC API =================
+def submit_ingestion_job(
+    pdf_path: str,
+    start_page: int,
+    end_page: Optional[int],
+    meta: Optional[dict] = None,
+    document_id: Optional[str] = None,
+) -> str:
+    """
+    Queue an ingestion run and return its job id.
+    document_id: None → derived from the file contents (see document_id_for)
+    Raises QueueFullError when MAX_QUEUED_JOBS are already pending.
+    """
+    job_id = str(uuid.uuid4())
+    progress = {
+        "partitioned": 0,
+        "partition_failed": 0,
+        "summarized": 0,
+        "embedded": 0,
+    }
+
+    get_job_store().create(
+        {
+            "id": job_id,
+            "status": "queued",
+            "owner_host": HOSTNAME,
+            "owner_pid": os.getpid(),
+            "meta": meta or {},
+            "progress": progress,
+            "result": None,
+            "error": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+        },
+        max_pending=MAX_QUEUED_JOBS,
+    )
+
+    _executor.submit(_run_job, job_id, pdf_path, start_page, end_page, document_id, dict(progress))
+    return job_id
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    """Return a copy of the job record, or None if unknown (any worker's job)."""
+    return get_job_store().get(job_id)
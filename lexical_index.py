@@ -0,0 +1,317 @@
+"""
+Persistent BM25 lexical index
+Built next to the Chroma store during ingestion and queried by
+HybridRetriever. Postings live in SQLite keyed by (term, doc_id), so a
+query only touches the postings of its own terms. Each posting also
+stores its BM25 term weight ("impact") and is indexed by it, so a query
+reads at most MAX_POSTINGS_PER_TERM postings per term, best first.
+"""
+
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Iterable, List, Tuple
+
+# ================= CONFIG =================
+BM25_K1 = 1.2
+BM25_B = 0.75
+MAX_DF_RATIO = 0.5      # terms in more than half the chunks carry ~no signal
+DF_CUTOFF_MIN_DOCS = 1000
+MAX_POSTINGS_PER_TERM = int(os.getenv("LEXICAL_MAX_POSTINGS_PER_TERM", "2000"))   # 0 → all
+
+# ignored when measuring how much of a query a chunk covers
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it me my of on "
+    "or that the this to was what when where which who why will with you your".split()
+)
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.,][0-9]+)*")
+
+UNITS = r"mm|cm|m|bar|rpm|kg|°c|kw|nm"
+
+# value + unit, e.g. "5.5 mm", "5,5mm", "10 bar", "1,500 rpm"
+UNIT_VALUE_PATTERN = re.compile(
+    r"(?<![\w.,])(\d+(?:[.,]\d+)?)\s?(" + UNITS + r")\b"
+)
+
+
+# ================= HELPERS =================
+def tokenize(text: str) -> List[str]:
+    """Lowercase word/number tokens; keeps decimals like 5.5 intact."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def normalize_value(raw: str) -> str:
+    """
+    "5,5" → "5.5", "5.50" → "5.5", "10.0" → "10".
+    A comma followed by exactly three digits is a thousands separator
+    ("1,500" → "1500").
+    """
+    if re.fullmatch(r"\d+,\d{3}", raw):
+        raw = raw.replace(",", "")
+    integer, _, fraction = raw.replace(",", ".").partition(".")
+
+    integer = integer.lstrip("0") or "0"
+    fraction = fraction.rstrip("0")
+    return f"{integer}.{fraction}" if fraction else integer
+
+
+def term_impact(tf: int, length: int, avg_len: float) -> float:
+    """BM25 term-frequency component (without idf)."""
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * length / max(avg_len, 1))
+    return tf * (BM25_K1 + 1) / (tf + norm)
+
+
+def extract_unit_values(text: str) -> List[Tuple[str, str]]:
+    """Normalized (value, unit) pairs found in text, in order, deduplicated."""
+    seen = []
+    for value, unit in UNIT_VALUE_PATTERN.findall(text.lower()):
+        pair = (normalize_value(value), unit)
+        if pair not in seen:
+            seen.append(pair)
+    return seen
+
+
+# ================= INDEX =================
+class LexicalIndex:
+    """
+    tables:
+    - docs(doc_id, length)
+    - terms(term, df)
+    - postings(term, doc_id, tf, impact) → impact = term_impact() with the
+      average length at write time; only used to order / cap postings,
+      scores are recomputed with the current average
+    - meta(doc_count, total_length) → BM25 stats without full scans
+    - unit_postings(value, unit, doc_id) → exact numeric/unit lookups
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS docs (
+                doc_id TEXT PRIMARY KEY,
+                length INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS terms (
+                term TEXT PRIMARY KEY,
+                df INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                doc_id TEXT NOT NULL,
+                tf INTEGER NOT NULL,
+                impact REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (term, doc_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_postings_doc ON postings(doc_id);
+            CREATE TABLE IF NOT EXISTS unit_postings (
+                value TEXT NOT NULL,
+                unit TEXT NOT NULL,
+                doc_id TEXT NOT NULL,
+                PRIMARY KEY (value, unit, doc_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_unit_postings_doc ON unit_postings(doc_id);
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO meta (key, value) VALUES ('doc_count', 0);
+            INSERT OR IGNORE INTO meta (key, value) VALUES ('total_length', 0);
+            """
+        )
+        self._add_impacts()
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_postings_impact ON postings(term, impact DESC)"
+        )
+        self.conn.commit()
+
+    def _add_impacts(self):
+        """Indexes built before postings carried an impact → add and backfill it."""
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(postings)")]
+        if "impact" in columns:
+            return
+
+        self.conn.execute("ALTER TABLE postings ADD COLUMN impact REAL NOT NULL DEFAULT 0")
+        avg_len = self._avg_len()
+        self.conn.executemany(
+            "UPDATE postings SET impact = ? WHERE term = ? AND doc_id = ?",
+            [
+                (term_impact(tf, length, avg_len), term, doc_id)
+                for term, doc_id, tf, length in self.conn.execute(
+                    "SELECT p.term, p.doc_id, p.tf, d.length FROM postings p "
+                    "JOIN docs d ON d.doc_id = p.doc_id"
+                ).fetchall()
+            ]
+        )
+
+    def _avg_len(self) -> float:
+        meta = dict(self.conn.execute("SELECT key, value FROM meta"))
+        return meta["total_length"] / meta["doc_count"] if meta["doc_count"] > 0 else 0.0
+
+    # ---------- writes ----------
+    def _delete_one(self, doc_id: str):
+        row = self.conn.execute(
+            "SELECT length FROM docs WHERE doc_id = ?", (doc_id,)
+        ).fetchone()
+        if row is None:
+            return
+
+        terms = [
+            t for (t,) in self.conn.execute(
+                "SELECT term FROM postings WHERE doc_id = ?", (doc_id,)
+            )
+        ]
+        self.conn.executemany(
+            "UPDATE terms SET df = df - 1 WHERE term = ?", [(t,) for t in terms]
+        )
+        self.conn.execute("DELETE FROM postings WHERE doc_id = ?", (doc_id,))
+        self.conn.execute("DELETE FROM unit_postings WHERE doc_id = ?", (doc_id,))
+        self.conn.execute("DELETE FROM docs WHERE doc_id = ?", (doc_id,))
+        self.conn.execute("UPDATE meta SET value = value - 1 WHERE key = 'doc_count'")
+        self.conn.execute(
+            "UPDATE meta SET value = value - ? WHERE key = 'total_length'", (row[0],)
+        )
+
+    def upsert(self, docs: Iterable[Tuple[str, str]]):
+        """docs: (doc_id, text) pairs; existing ids are replaced."""
+        with self.lock:
+            for doc_id, text in docs:
+                self._delete_one(doc_id)
+
+                tokens = tokenize(text)
+                counts = Counter(tokens)
+
+                self.conn.execute(
+                    "INSERT INTO docs (doc_id, length) VALUES (?, ?)",
+                    (doc_id, len(tokens))
+                )
+                avg_len = self._avg_len() or len(tokens)
+                self.conn.executemany(
+                    "INSERT INTO postings (term, doc_id, tf, impact) VALUES (?, ?, ?, ?)",
+                    [
+                        (term, doc_id, tf, term_impact(tf, len(tokens), avg_len))
+                        for term, tf in counts.items()
+                    ]
+                )
+                self.conn.executemany(
+                    "INSERT INTO terms (term, df) VALUES (?, 1) "
+                    "ON CONFLICT(term) DO UPDATE SET df = df + 1",
+                    [(term,) for term in counts]
+                )
+                self.conn.executemany(
+                    "INSERT INTO unit_postings (value, unit, doc_id) VALUES (?, ?, ?)",
+                    [(value, unit, doc_id) for value, unit in extract_unit_values(text)]
+                )
+                self.conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'doc_count'")
+                self.conn.execute(
+                    "UPDATE meta SET value = value + ? WHERE key = 'total_length'",
+                    (len(tokens),)
+                )
+
+            self.conn.commit()
+
+    def delete(self, doc_ids: Iterable[str]):
+        with self.lock:
+            for doc_id in doc_ids:
+                self._delete_one(doc_id)
+            self.conn.commit()
+
+    def missing(self, doc_ids: List[str]) -> List[str]:
+        """Ids not yet in the index (e.g. stored before the index existed)."""
+        with self.lock:
+            present = set()
+            for i in range(0, len(doc_ids), 500):
+                chunk = doc_ids[i:i + 500]
+                present.update(
+                    d for (d,) in self.conn.execute(
+                        f"SELECT doc_id FROM docs WHERE doc_id IN ({','.join('?' * len(chunk))})",
+                        chunk
+                    )
+                )
+        return [d for d in doc_ids if d not in present]
+
+    # ---------- reads ----------
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Top-k (doc_id, bm25 score), best first."""
+        return [(doc_id, score) for doc_id, score, _ in self.search_with_coverage(query, k)]
+
+    def search_with_coverage(self, query: str, k: int = 10) -> List[Tuple[str, float, float]]:
+        """
+        Top-k (doc_id, bm25 score, coverage), best first.
+        coverage = idf-weighted share of the query's informative terms the
+        doc contains (1.0 → all of them present). Stopwords and terms in
+        more than MAX_DF_RATIO of the chunks are not informative; terms the
+        index has never seen count with the maximum idf, so an off-topic
+        query cannot reach full coverage through its common words.
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+
+        with self.lock:
+            meta = dict(self.conn.execute("SELECT key, value FROM meta"))
+            doc_count = meta["doc_count"]
+            if doc_count <= 0:
+                return []
+            avg_len = meta["total_length"] / doc_count
+            max_df = MAX_DF_RATIO * doc_count if doc_count >= DF_CUTOFF_MIN_DOCS else doc_count
+
+            scores = Counter()
+            matched_idf = Counter()
+            total_idf = 0.0
+
+            for term in terms:
+                row = self.conn.execute(
+                    "SELECT df FROM terms WHERE term = ?", (term,)
+                ).fetchone()
+                df = row[0] if row else 0
+                idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+                informative = term not in STOPWORDS and df <= MAX_DF_RATIO * doc_count
+
+                if informative:
+                    total_idf += idf
+
+                if df <= 0 or df > max_df:
+                    continue
+
+                # highest-impact postings first; a very common term only
+                # contributes its best MAX_POSTINGS_PER_TERM documents
+                for doc_id, tf, length in self.conn.execute(
+                    "SELECT p.doc_id, p.tf, d.length FROM postings p "
+                    "JOIN docs d ON d.doc_id = p.doc_id WHERE p.term = ? "
+                    "ORDER BY p.impact DESC LIMIT ?",
+                    (term, MAX_POSTINGS_PER_TERM if MAX_POSTINGS_PER_TERM > 0 else -1)
+                ):
+                    scores[doc_id] += idf * term_impact(tf, length, avg_len)
+                    if informative:
+                        matched_idf[doc_id] += idf
+
+        return [
+            (doc_id, score, matched_idf[doc_id] / total_idf if total_idf else 0.0)
+            for doc_id, score in scores.most_common(k)
+        ]
+
+    def lookup_unit_values(self, pairs: List[Tuple[str, str]], k: int = 10) -> List[str]:
+        """
+        Doc ids containing any of the normalized (value, unit) pairs,
+        most pairs matched first. Cost is O(postings of those pairs).
+        """
+        matches = Counter()
+
+        with self.lock:
+            for value, unit in pairs:
+                for (doc_id,) in self.conn.execute(
+                    "SELECT doc_id FROM unit_postings WHERE value = ? AND unit = ?",
+                    (value, unit)
+                ):
+                    matches[doc_id] += 1
+
+        return [doc_id for doc_id, _ in matches.most_common(k)]
@@ -0,0 +1,158 @@
+"""
+Content-addressed on-disk store for image / table crop bytes
+Partitioning writes each payload once as <root>/<hh>/<sha256> and the
+element keeps only metadata.image_ref ("sha256:<hex>") instead of the
+base64 string. Identical crops are stored once.
+Blobs are only read while a document is being ingested (nothing stored
+in Chroma points at them), so prune() after a run drops every blob not
+written or reused within BLOB_STORE_MAX_AGE_SECONDS.
+"""
+
+import base64
+import hashlib
+import os
+import time
+from typing import Iterable, Optional
+
+# ================= CONFIG =================
+BLOB_DIR = os.getenv("BLOB_STORE_DIR", "./blob_store")
+ENABLED = os.getenv("BLOB_STORE_ENABLED", "1") == "1"
+# an ingestion run must finish within this long, or its blobs may be pruned
+MAX_AGE_SECONDS = float(os.getenv("BLOB_STORE_MAX_AGE_SECONDS", "86400"))   # 0 → never prune
+REF_PREFIX = "sha256:"
+
+
+# ================= HELPERS =================
+def is_blob_ref(payload: str) -> bool:
+    # ":" is not a base64 character → never confused with an inline payload
+    return payload.startswith(REF_PREFIX)
+
+
+# ================= STORE =================
+class BlobStore:
+
+    def __init__(self, root: str = BLOB_DIR):
+        self.root = root
+
+    def path_for(self, ref: str) -> str:
+        digest = ref[len(REF_PREFIX):] if is_blob_ref(ref) else ref
+        return os.path.join(self.root, digest[:2], digest)
+
+    def put(self, data: bytes) -> str:
+        """Store bytes (once) and return their reference."""
+        digest = hashlib.sha256(data).hexdigest()
+        ref = REF_PREFIX + digest
+        path = self.path_for(ref)
+
+        if os.path.exists(path):
+            # reused by this run → not pruned while the run still needs it
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+            else:
+                return ref
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        # atomic → concurrent partition workers writing the same crop are fine
+        os.replace(tmp, path)
+
+        return ref
+
+    def get(self, ref: str, limit: Optional[int] = None) -> bytes:
+        """Bytes of a stored blob; limit → only the first `limit` bytes."""
+        with open(self.path_for(ref), "rb") as f:
+            return f.read() if limit is None else f.read(limit)
+
+    def exists(self, ref: str) -> bool:
+        return os.path.exists(self.path_for(ref))
+
+    def prune(self, older_than: float = MAX_AGE_SECONDS, keep: Iterable[str] = ()) -> int:
+        """
+        Delete blobs (and leftover .tmp files) last written / reused more
+        than `older_than` seconds ago, except those in `keep`.
+        Returns the number of files removed.
+        """
+        if not os.path.isdir(self.root):
+            return 0
+
+        keep_paths = {self.path_for(ref) for ref in keep}
+        cutoff = time.time() - older_than
+        removed = 0
+
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.path in keep_paths:
+                    continue
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+
+        return removed
+
+
+blob_store = BlobStore()
+
+
+def prune_blobs(store: BlobStore = blob_store) -> int:
+    """End-of-run cleanup (no-op when the store is off or MAX_AGE_SECONDS is 0)."""
+    if not ENABLED or MAX_AGE_SECONDS <= 0:
+        return 0
+
+    removed = store.prune(MAX_AGE_SECONDS)
+    if removed:
+        print(f"🧹 Pruned {removed} stale blobs")
+    return removed
+
+
+# ================= ELEMENT HELPERS =================
+def spill_image_payload(el, store: BlobStore = blob_store) -> Optional[str]:
+    """Move metadata.image_base64 into the store, leaving metadata.image_ref."""
+    image_b64 = getattr(el.metadata, "image_base64", None)
+    if not image_b64:
+        return None
+
+    ref = store.put(base64.b64decode(image_b64))
+    el.metadata.image_ref = ref
+    el.metadata.image_base64 = None
+    return ref
+
+
+def image_payload(el) -> Optional[str]:
+    """Blob reference or inline base64 of an element, whichever it carries."""
+    metadata = getattr(el, "metadata", None)
+    if metadata is None:
+        return None
+    return getattr(metadata, "image_ref", None) or getattr(metadata, "image_base64", None)
+
+
+def payload_bytes(payload: str, limit: Optional[int] = None, store: BlobStore = blob_store) -> bytes:
+    """
+    Raw bytes of a payload (blob reference or base64).
+    limit → at least the first `limit` bytes, not necessarily all.
+    """
+    if is_blob_ref(payload):
+        return store.get(payload, limit)
+
+    if limit is not None:
+        chars = -(-limit // 3) * 4          # base64 chars covering `limit` bytes
+        payload = payload[:chars]
+        payload = payload[:len(payload) - len(payload) % 4]
+
+    return base64.b64decode(payload)
+
+
+def load_image_bytes(el, store: BlobStore = blob_store) -> Optional[bytes]:
+    """Image bytes of an element, read lazily from the store when spilled."""
+    payload = image_payload(el)
+    if not payload:
+        return None
+    return payload_bytes(payload, store=store)
@@ -0,0 +1,248 @@
+"""
+Compact columnar representation of one partitioned page
+Instead of a list of Element objects (each with its own metadata
+object), a page is held as parallel arrays:
+- category codes (uint8) into a small per-page category table
+- bounding boxes (float32, NaN without coordinates) + first-point y
+- text offsets (int32) into one string buffer
+- image payloads (blob references / base64) by row, kept separately
+
+The cleaning stages and vector_store_builder accept either form; the
+row helpers at the bottom of this module hide the difference.
+"""
+
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from loadingandcleaning.blob_store import image_payload, is_blob_ref
+from loadingandcleaning.spatial_index import PageSpatialIndex, element_box
+
+# metadata copied per row (sparse) so to_elements() round-trips what the
+# pipeline reads; page-level fields are stored once
+ROW_METADATA_FIELDS = ("text_as_html", "image_mime_type")
+PAGE_METADATA_FIELDS = ("page_number", "filename", "partition_strategy")
+
+
+# ================= PAGE =================
+class ColumnarPage:
+
+    __slots__ = (
+        "category_names", "categories", "boxes", "first_y",
+        "buffer", "offsets", "image_payloads",
+        "row_metadata", "page_metadata", "coordinate_system",
+    )
+
+    def __init__(
+        self,
+        category_names: List[str],
+        categories: np.ndarray,
+        boxes: np.ndarray,
+        first_y: np.ndarray,
+        buffer: str,
+        offsets: np.ndarray,
+        image_payloads: Optional[Dict[int, str]] = None,
+        row_metadata: Optional[Dict[int, dict]] = None,
+        page_metadata: Optional[dict] = None,
+        coordinate_system=None,
+    ):
+        self.category_names = category_names
+        self.categories = categories
+        self.boxes = boxes
+        self.first_y = first_y
+        self.buffer = buffer
+        self.offsets = offsets
+        self.image_payloads = image_payloads or {}
+        self.row_metadata = row_metadata or {}
+        self.page_metadata = page_metadata or {}
+        self.coordinate_system = coordinate_system
+
+    def __len__(self) -> int:
+        return len(self.categories)
+
+    # ---------- rows ----------
+    def category(self, i: int) -> str:
+        return self.category_names[self.categories[i]]
+
+    def text(self, i: int) -> str:
+        return self.buffer[self.offsets[i]:self.offsets[i + 1]]
+
+    def texts(self) -> List[str]:
+        return [self.text(i) for i in range(len(self))]
+
+    def rows_of(self, category: str) -> np.ndarray:
+        if category not in self.category_names:
+            return np.empty(0, dtype=np.int64)
+        return np.flatnonzero(self.categories == self.category_names.index(category))
+
+    def spatial_index(self) -> PageSpatialIndex:
+        """Spatial index straight over the stored boxes (nothing re-parsed)."""
+        return PageSpatialIndex(self, self.boxes.astype(np.float64), self.first_y.astype(np.float64))
+
+    # ---------- derive ----------
+    def select(self, rows: Iterable[int], texts: Optional[Dict[int, str]] = None) -> "ColumnarPage":
+        """New page with only `rows` (in that order); texts overrides {old row: text}."""
+        rows = np.asarray(list(rows), dtype=np.int64)
+        texts = texts or {}
+        remap = {int(old): new for new, old in enumerate(rows)}
+
+        parts = [texts[int(i)] if int(i) in texts else self.text(i) for i in rows]
+        offsets = np.zeros(len(parts) + 1, dtype=np.int32)
+        np.cumsum([len(p) for p in parts], out=offsets[1:])
+
+        def moved(mapping):
+            return {remap[old]: value for old, value in mapping.items() if old in remap}
+
+        return ColumnarPage(
+            self.category_names,
+            self.categories[rows],
+            self.boxes[rows],
+            self.first_y[rows],
+            "".join(parts),
+            offsets,
+            moved(self.image_payloads),
+            moved(self.row_metadata),
+            self.page_metadata,
+            self.coordinate_system,
+        )
+
+    # ---------- conversions ----------
+    @classmethod
+    def from_elements(cls, elements: List) -> "ColumnarPage":
+        n = len(elements)
+        category_names = []
+        categories = np.zeros(n, dtype=np.uint8)
+        boxes = np.full((n, 4), np.nan, dtype=np.float32)
+        first_y = np.full(n, np.nan, dtype=np.float32)
+        parts = []
+        image_payloads = {}
+        row_metadata = {}
+        page_metadata = {}
+        coordinate_system = None
+
+        for i, el in enumerate(elements):
+            if el.category not in category_names:
+                category_names.append(el.category)
+            categories[i] = category_names.index(el.category)
+
+            box = element_box(el)
+            if box is not None:
+                boxes[i] = box[:4]
+                first_y[i] = box[4]
+                coordinate_system = coordinate_system or el.metadata.coordinates.system
+
+            parts.append(getattr(el, "text", None) or "")
+
+            payload = image_payload(el)
+            if payload:
+                image_payloads[i] = payload
+
+            metadata = el.metadata
+            if metadata is None:
+                continue
+
+            extra = {
+                field: getattr(metadata, field)
+                for field in ROW_METADATA_FIELDS
+                if getattr(metadata, field, None) is not None
+            }
+            if extra:
+                row_metadata[i] = extra
+
+            for field in PAGE_METADATA_FIELDS:
+                if field not in page_metadata and getattr(metadata, field, None) is not None:
+                    page_metadata[field] = getattr(metadata, field)
+
+        offsets = np.zeros(n + 1, dtype=np.int32)
+        np.cumsum([len(p) for p in parts], out=offsets[1:])
+
+        return cls(
+            category_names, categories, boxes, first_y,
+            "".join(parts), offsets,
+            image_payloads, row_metadata, page_metadata, coordinate_system,
+        )
+
+    def to_elements(self) -> List:
+        """Rebuild unstructured elements (for the stages that need real Elements)."""
+        from unstructured.documents.elements import (
+            TYPE_TO_TEXT_ELEMENT_MAP, ElementMetadata, Image, Table, Text,
+        )
+
+        classes = {**TYPE_TO_TEXT_ELEMENT_MAP, "Image": Image, "Table": Table}
+        elements = []
+
+        for i in range(len(self)):
+            metadata = ElementMetadata()
+            for field, value in self.page_metadata.items():
+                setattr(metadata, field, value)
+            for field, value in self.row_metadata.get(i, {}).items():
+                setattr(metadata, field, value)
+
+            payload = self.image_payloads.get(i)
+            if payload:
+                if is_blob_ref(payload):
+                    metadata.image_ref = payload
+                else:
+                    metadata.image_base64 = payload
+
+            coordinates = None
+            if not np.isnan(self.boxes[i, 1]) and self.coordinate_system is not None:
+                x0, y0, x1, y1 = (float(v) for v in self.boxes[i])
+                coordinates = ((x0, y0), (x0, y1), (x1, y1), (x1, y0))
+
+            el_cls = classes.get(self.category(i), Text)
+            elements.append(
+                el_cls(
+                    text=self.text(i),
+                    coordinates=coordinates,
+                    coordinate_system=self.coordinate_system if coordinates else None,
+                    metadata=metadata,
+                )
+            )
+
+        return elements
+
+
+# ================= PUBLIC API =================
+def to_columnar(pages: Dict[int, List]) -> Dict[int, ColumnarPage]:
+    return {page_num: ColumnarPage.from_elements(elements) for page_num, elements in pages.items()}
+
+
+def to_element_pages(pages: Dict[int, object]) -> Dict[int, List]:
+    return {
+        page_num: page.to_elements() if isinstance(page, ColumnarPage) else page
+        for page_num, page in pages.items()
+    }
+
+
+# ================= ROW HELPERS =================
+# stages call these with either an Element list or a ColumnarPage
+def category_at(page, i: int) -> str:
+    if isinstance(page, ColumnarPage):
+        return page.category(i)
+    return page[i].category
+
+
+def text_at(page, i: int) -> Optional[str]:
+    if isinstance(page, ColumnarPage):
+        return page.text(i)
+    return getattr(page[i], "text", None)
+
+
+def image_payload_at(page, i: int) -> Optional[str]:
+    if isinstance(page, ColumnarPage):
+        return page.image_payloads.get(i)
+    return image_payload(page[i])
+
+
+def keep_rows(page, rows: Iterable[int], texts: Optional[Dict[int, str]] = None):
+    """Same kind of page with only `rows`; texts overrides {row: text}."""
+    if isinstance(page, ColumnarPage):
+        return page.select(rows, texts)
+
+    kept = []
+    for i in rows:
+        if texts and i in texts:
+            page[i].text = texts[i]
+        kept.append(page[i])
+    return kept
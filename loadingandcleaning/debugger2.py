@@ -1,6 +1,6 @@
 from io import BytesIO
 from PIL import Image as PILImage
-import base64
+from loadingandcleaning.blob_store import image_payload, load_image_bytes
 from unstructured.documents.elements import Image
 
 
@@ -10,7 +10,7 @@ def debugger(pages: dict):
     Shows:
     - Elements (Text, NarrativeText, Title, etc.)
     - Tables (resolved + spillover merged)
-    - Images (inline preview if base64 exists)
+    - Images (inline preview if image bytes exist)
     """
 
     for page_num, page_data in pages.items():
@@ -28,9 +28,9 @@ def debugger(pages: dict):
             print("Text:", getattr(el, "text", None))
 
             # 🔍 IMAGE PREVIEW (safe)
-            if isinstance(el, Image) and el.metadata and el.metadata.image_base64:
+            if isinstance(el, Image) and el.metadata and image_payload(el):
                 try:
-                    img_bytes = base64.b64decode(el.metadata.image_base64)
+                    img_bytes = load_image_bytes(el)
                     img = PILImage.open(BytesIO(img_bytes))
                     display(img)
                 except Exception as e:
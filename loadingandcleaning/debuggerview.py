@@ -1,8 +1,8 @@
 from io import BytesIO
 from PIL import Image as PILImage
-import base64
 import os
 import re
+from loadingandcleaning.blob_store import image_payload, load_image_bytes
 from unstructured.documents.elements import Element, Text, Image, FigureCaption
 
 def debugger(partitioned_pages):
@@ -20,8 +20,8 @@ def debugger(partitioned_pages):
 
             # 🔍 IMAGE PREVIEW (unchanged logic)
 
-            if isinstance(el, Image) and el.metadata and el.metadata.image_base64:
-                img_bytes = base64.b64decode(el.metadata.image_base64)
+            if isinstance(el, Image) and el.metadata and image_payload(el):
+                img_bytes = load_image_bytes(el)
                 img = PILImage.open(BytesIO(img_bytes))
 
                 display(img)
@@ -1,6 +1,8 @@
 from collections import defaultdict
 import re
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
+from loadingandcleaning.spatial_index import PageSpatialIndex, index_for
+from loadingandcleaning.columnar_page import ColumnarPage, keep_rows, text_at
 
 # ================= CONFIG =================
 TOP_PERCENT = 0.15        # top 15% of page
@@ -32,12 +34,14 @@ def is_valid_candidate(text: str) -> bool:
 
 # ================= CORE LOGIC =================
 def detect_headers_footers(
-    pages: Dict[int, List]
+    pages: Dict[int, List],
+    indexes: Optional[Dict[int, PageSpatialIndex]] = None,
 ) -> Tuple[set, set]:
     """
     Detect repeating headers and footers.
 
-    pages: { page_number: [unstructured elements] }
+    pages: { page_number: [unstructured elements] or ColumnarPage }
+    indexes: optional { page_number: PageSpatialIndex } built after partitioning
     """
     top_candidates = defaultdict(set)
     bottom_candidates = defaultdict(set)
@@ -48,38 +52,28 @@ def detect_headers_footers(
         if not elements:
             continue
 
-        # Collect vertical positions
-        y_positions = [
-            el.metadata.coordinates.points[0][1]
-            for el in elements
-            if el.metadata and el.metadata.coordinates
-        ]
-
-        if not y_positions:
-            continue
+        if isinstance(elements, ColumnarPage):
+            index = elements.spatial_index()
+        else:
+            index = index_for(indexes, page_num, elements)
 
-        min_y = min(y_positions)
-        max_y = max(y_positions)
-        page_height = max(max_y - min_y, 1)
+        # top / bottom bands from the vertical positions, vectorized
+        in_top, in_bottom = index.bands(TOP_PERCENT, BOTTOM_PERCENT)
 
-        for el in elements:
-            if not hasattr(el, "text"):
+        for i in (in_top | in_bottom).nonzero()[0]:
+            raw_text = text_at(elements, i)
+            if raw_text is None:
                 continue
 
-            raw_text = el.text.strip()
+            raw_text = raw_text.strip()
             if not is_valid_candidate(raw_text):
                 continue
 
-            if not el.metadata or not el.metadata.coordinates:
-                continue
-
             norm_text = normalize_text(raw_text)
-            y = el.metadata.coordinates.points[0][1]
 
-            if y <= min_y + TOP_PERCENT * page_height:
+            if in_top[i]:
                 top_candidates[norm_text].add(page_num)
-
-            elif y >= max_y - BOTTOM_PERCENT * page_height:
+            else:
                 bottom_candidates[norm_text].add(page_num)
 
     headers = {
@@ -102,24 +96,25 @@ def remove_headers_footers(
     headers: set,
     footers: set
 ) -> Dict[int, List]:
-    """Remove detected headers and footers from pages."""
+    """Remove detected headers and footers from pages (element lists or ColumnarPage)."""
     cleaned_pages = {}
 
     for page_num, elements in pages.items():
-        cleaned_elements = []
+        kept_rows = []
 
-        for el in elements:
-            if not hasattr(el, "text"):
-                cleaned_elements.append(el)
+        for i in range(len(elements)):
+            text = text_at(elements, i)
+            if text is None:
+                kept_rows.append(i)
                 continue
 
-            norm = normalize_text(el.text)
+            norm = normalize_text(text)
             if norm in headers or norm in footers:
                 continue
 
-            cleaned_elements.append(el)
+            kept_rows.append(i)
 
-        cleaned_pages[page_num] = cleaned_elements
+        cleaned_pages[page_num] = keep_rows(elements, kept_rows)
 
     return cleaned_pages
 
@@ -128,12 +123,14 @@ def remove_headers_footers(
 def clean_headers_footers_range(
     partitioned_pages: Dict[int, List],
     start_page: int,
-    end_page: int
+    end_page: int,
+    indexes: Optional[Dict[int, PageSpatialIndex]] = None,
 ):
     """
     Clean headers & footers for a specific page range.
 
     partitioned_pages: { page_number: [elements] }
+    indexes: optional spatial indexes (see spatial_index)
     """
     page_range = {
         p: els
@@ -144,7 +141,7 @@ def clean_headers_footers_range(
     if len(page_range) < 3:
         print("⚠️ Warning: Header/footer detection works best with ≥3 pages")
 
-    headers, footers = detect_headers_footers(page_range)
+    headers, footers = detect_headers_footers(page_range, indexes)
 
     print(f"🧹 Headers detected: {len(headers)}")
     print(f"🧹 Footers detected: {len(footers)}")
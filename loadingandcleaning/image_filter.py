@@ -1,8 +1,12 @@
-import base64
+import os
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from io import BytesIO
 from PIL import Image as PILImage
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
+from loadingandcleaning.blob_store import payload_bytes
+from loadingandcleaning.columnar_page import category_at, image_payload_at, keep_rows
 
 # ================= CONFIG =================
 MIN_WIDTH_PX = 50
@@ -13,37 +17,82 @@ MIN_AREA_PX = 300 * 300
 UNIFORM_PIXEL_THRESHOLD = 0.98
 BLACK_FILL_THRESHOLD = 0.85 
 
+TINY_AREA_PX = 50 * 50
+
+# triage: size check from the image header only, blob check on a thumbnail
+HEADER_BYTES = 6144              # payload prefix read to get width/height
+THUMBNAIL_MAX_SIDE = 256         # block-min downsample before the dark-blob check
+BORDERLINE_MARGIN = 0.05         # thumbnail results this close to a threshold are redone at full size
+SMALL_BOX_PX = 16                # thumbnail dark regions this small (either side) are redone at full size
+
+# pixel analysis of surviving images is spread over processes
+IMAGE_FILTER_WORKERS = int(os.getenv("IMAGE_FILTER_WORKERS", "1"))
+MIN_IMAGES_FOR_POOL = 8
+
+# near-duplicate grouping (dHash) of kept images across the document, used
+# to drop later copies of logos / icons repeated on many pages; images
+# are only hashed when this is on
+DHASH_MAX_DISTANCE = 6           # Hamming distance (of 64 bits) still counted as the same image
+DROP_DECORATIVE_REPEATS = os.getenv("IMAGE_DROP_DECORATIVE_REPEATS", "0") == "1"
+DECORATIVE_MIN_PAGES = int(os.getenv("IMAGE_DECORATIVE_MIN_PAGES", "3"))   # logos / icons
+
 # ================= HELPERS =================
-def is_useful_image(image_base64: str) -> bool:
+def image_size_from_header(payload: str) -> Optional[Tuple[int, int]]:
+    """
+    (width, height) without decoding pixels. Only a prefix of the payload
+    (blob reference or base64) is read; PIL reads the size from the
+    header lazily. None if the payload is not an image.
+    """
     try:
-        img_bytes = base64.b64decode(image_base64)
-        img = PILImage.open(BytesIO(img_bytes)).convert("L")
+        with PILImage.open(BytesIO(payload_bytes(payload, HEADER_BYTES))) as img:
+            return img.size
     except Exception:
-        return False
+        pass
 
-    width, height = img.size
-    area = width * height
+    # header not within the prefix → read the whole payload
+    try:
+        with PILImage.open(BytesIO(payload_bytes(payload))) as img:
+            return img.size
+    except Exception:
+        return None
 
-    # tiny images → noise
-    if area < 50 * 50:
-        return False
 
-    pixels = np.array(img)
+def _min_pool(pixels: np.ndarray, max_side: int) -> np.ndarray:
+    """
+    Downsample by taking the darkest pixel of each block, so a dark pixel
+    anywhere (even a 1 px hairline) stays dark in the thumbnail.
+    """
+    height, width = pixels.shape
+    factor = -(-max(height, width) // max_side)
+    if factor <= 1:
+        return pixels
+
+    pad_h, pad_w = -height % factor, -width % factor
+    padded = np.pad(pixels, ((0, pad_h), (0, pad_w)), constant_values=255)
+    return padded.reshape(
+        padded.shape[0] // factor, factor, padded.shape[1] // factor, factor
+    ).min(axis=(1, 3))
+
+
+def _dark_blob_stats(pixels: np.ndarray) -> Optional[Tuple[float, float, float, int]]:
+    """
+    (fill_ratio, aspect_ratio, box_area / area, shorter box side in px)
+    of the dark region of a grayscale array, None if no dark pixels.
+    """
+    area = pixels.shape[0] * pixels.shape[1]
 
     # binary mask of dark pixels
     mask = pixels <= NEAR_BLACK_MAX
     black_pixels = np.sum(mask)
 
     if black_pixels == 0:
-        return False
+        return None
 
     # bounding box of black region
-    ys, xs = np.where(mask)
-    x_min, x_max = xs.min(), xs.max()
-    y_min, y_max = ys.min(), ys.max()
-
-    box_width = x_max - x_min + 1
-    box_height = y_max - y_min + 1
+    rows = np.flatnonzero(mask.any(axis=1))
+    cols = np.flatnonzero(mask.any(axis=0))
+    box_width = cols[-1] - cols[0] + 1
+    box_height = rows[-1] - rows[0] + 1
     box_area = box_width * box_height
 
     # how filled is the bounding box
@@ -51,46 +100,228 @@ def is_useful_image(image_base64: str) -> bool:
 
     aspect_ratio = box_width / max(box_height, 1)
 
+    return fill_ratio, aspect_ratio, box_area / area, min(box_width, box_height)
+
+
+def _is_dark_blob(fill_ratio: float, aspect_ratio: float, box_share: float) -> bool:
     # 🔥 THIS catches your black circles
-    if (
+    return (
         fill_ratio > 0.75 and          # dense blob
         0.75 < aspect_ratio < 1.25 and # roughly square
-        box_area < area * 0.8          # not whole page
-    ):
+        box_share < 0.8                # not whole page
+    )
+
+
+def _is_borderline(fill_ratio: float, aspect_ratio: float, box_share: float, box_side: int) -> bool:
+    """
+    Could the thumbnail have flipped the decision? Sampling shifts a box
+    edge by up to one thumbnail pixel, so the margin grows as the dark
+    region gets smaller; tiny regions are always redone.
+    """
+    if box_side < SMALL_BOX_PX:
+        return True
+
+    margin = BORDERLINE_MARGIN + 2.0 / box_side
+    return any(
+        abs(value - limit) <= margin * max(limit, 1.0)
+        for value, limit in (
+            (fill_ratio, 0.75),
+            (aspect_ratio, 0.75),
+            (aspect_ratio, 1.25),
+            (box_share, 0.8),
+        )
+    )
+
+
+def _has_content(img: PILImage.Image) -> bool:
+    width, height = img.size
+    area = width * height
+
+    # tiny images → noise
+    if area < TINY_AREA_PX:
+        return False
+
+    pixels = np.asarray(img.convert("L"))
+
+    # dark-blob check on a block-min thumbnail: no dark pixel is lost, so
+    # "no dark pixels" is exact; only a clear keep is taken from it, a
+    # dense blob or a near-threshold result is redone at full resolution
+    thumb = _min_pool(pixels, THUMBNAIL_MAX_SIDE)
+    stats = _dark_blob_stats(thumb)
+    if stats is None:
         return False
 
-    return True
+    if thumb is not pixels and (_is_dark_blob(*stats[:3]) or _is_borderline(*stats)):
+        stats = _dark_blob_stats(pixels)
+
+    return not _is_dark_blob(*stats[:3])
+
+
+def dhash(img: PILImage.Image) -> int:
+    """64-bit difference hash: brighter-than-right-neighbour bits of a 9x8 grayscale."""
+    small = np.asarray(
+        img.convert("L").resize((9, 8), PILImage.BILINEAR, reducing_gap=2.0),
+        dtype=np.int16,
+    )
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def is_useful_image(payload: str) -> bool:
+    return _screen_one(payload)[0]
+
+
+def _screen_one(payload: str, with_hash: bool = False) -> Tuple[bool, Optional[int]]:
+    """(useful, dHash or None); the payload is read and decoded once for both."""
+    try:
+        img = PILImage.open(BytesIO(payload_bytes(payload)))
+
+        if not _has_content(img):
+            return False, None
+
+        return True, dhash(img) if with_hash else None
+    except Exception:
+        return False, None
+
+
+class ImageGroups:
+    """
+    Near-identical images across one document, grouped by dHash.
+    Keep one instance per document and pass it to every
+    filter_images_per_page() call (streaming ingestion calls it per page).
+    """
+
+    def __init__(self, max_distance: int = DHASH_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self.hashes = []     # representative hash per group
+        self.pages = []      # pages each group appears on
+        self.first = []      # (page_num, element index) of the first occurrence
+
+    def assign(self, image_hash: int, page_num: int, idx: int) -> int:
+        for group, rep in enumerate(self.hashes):
+            if bin(rep ^ image_hash).count("1") <= self.max_distance:
+                self.pages[group].add(page_num)
+                return group
+
+        self.hashes.append(image_hash)
+        self.pages.append({page_num})
+        self.first.append((page_num, idx))
+        return len(self.hashes) - 1
+
+    def is_decorative_repeat(self, group: int, page_num: int, idx: int) -> bool:
+        """A later copy of an image that already appeared on many pages."""
+        return (
+            len(self.pages[group]) >= DECORATIVE_MIN_PAGES
+            and self.first[group] != (page_num, idx)
+        )
+
+    def stats(self) -> dict:
+        return {
+            "groups": len(self.hashes),
+            "repeated_groups": sum(1 for pages in self.pages if len(pages) > 1),
+        }
+
+
+def _screen_images(payloads: List[str], workers: int, with_hash: bool = False) -> List[Tuple[bool, Optional[int]]]:
+    """Header pass in-process, pixel pass over a process pool when worth it."""
+    results = [(False, None)] * len(payloads)
+    candidates = []
+
+    for i, payload in enumerate(payloads):
+        size = image_size_from_header(payload)
+        if size is not None and size[0] * size[1] >= TINY_AREA_PX:
+            candidates.append(i)
+
+    print(f"🖼️ {len(payloads) - len(candidates)}/{len(payloads)} images rejected from header")
+
+    screen = partial(_screen_one, with_hash=with_hash)
+
+    if workers > 1 and len(candidates) >= MIN_IMAGES_FOR_POOL:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            screened = pool.map(
+                screen,
+                [payloads[i] for i in candidates],
+                chunksize=max(1, len(candidates) // (workers * 4)),
+            )
+            for i, result in zip(candidates, screened):
+                results[i] = result
+    else:
+        for i in candidates:
+            results[i] = screen(payloads[i])
+
+    return results
 
 # ================= CORE LOGIC =================
 def filter_images_per_page(
-    pages: Dict[int, List]
+    pages: Dict[int, List],
+    workers: int = IMAGE_FILTER_WORKERS,
+    groups: Optional[ImageGroups] = None,
+    drop_repeats: bool = DROP_DECORATIVE_REPEATS,
 ) -> Dict[int, List]:
     """
     Remove useless images from each page.
 
-    pages: { page_number: [unstructured elements] }
+    pages: { page_number: [unstructured elements] or ColumnarPage }
+    workers > 1 spreads the pixel checks over a process pool.
+
+    drop_repeats groups kept images by dHash (see ImageGroups) and
+    removes later copies of decorative repeats; pass one `groups` per
+    document when calling page by page.
     """
-    cleaned_pages = {}
+    if not drop_repeats:
+        groups = None
+    elif groups is None:
+        groups = ImageGroups()
 
-    for page_num, elements in pages.items():
-        print("image cleaning page no",page_num)
-        cleaned_elements = []
+    # (page_num, element index, payload) for every image on every page
+    images = []
 
-        for el in elements:
-            print("going in elements")
-            if el.category != "Image":
-                cleaned_elements.append(el)
+    for page_num, elements in pages.items():
+        for idx in range(len(elements)):
+            if category_at(elements, idx) != "Image":
                 continue
 
-            image_b64 = getattr(el.metadata, "image_base64", None)
-            if not image_b64:
+            # blob reference (see blob_store) or inline base64; pixels
+            # are only read by the checks that need them
+            payload = image_payload_at(elements, idx)
+            if not payload:
                 print("did not found image attr")
                 continue
 
-            if is_useful_image(image_b64):
-                cleaned_elements.append(el)
-            # else: drop silently (noise image)
+            images.append((page_num, idx, payload))
+
+    screened = _screen_images(
+        [payload for _, _, payload in images],
+        workers,
+        with_hash=groups is not None,
+    )
+
+    useful = set()
+    repeats = 0
+
+    for (page_num, idx, _), (is_kept, image_hash) in zip(images, screened):
+        if not is_kept:
+            continue
+
+        if groups is not None and image_hash is not None:
+            group = groups.assign(image_hash, page_num, idx)
+            if groups.is_decorative_repeat(group, page_num, idx):
+                repeats += 1
+                continue
+
+        useful.add((page_num, idx))
 
-        cleaned_pages[page_num] = cleaned_elements
+    if repeats:
+        print(f"🖼️ {repeats} decorative repeat image(s) dropped")
+
+    cleaned_pages = {}
+
+    for page_num, elements in pages.items():
+        print("image cleaning page no",page_num)
+        cleaned_pages[page_num] = keep_rows(elements, [
+            idx for idx in range(len(elements))
+            if category_at(elements, idx) != "Image" or (page_num, idx) in useful
+        ])
+        # else: drop silently (noise image)
 
     return cleaned_pages
@@ -1,4 +1,4 @@
-from typing import Dict, List
+from typing import Dict, List, Optional
 from langchain_core.prompts import PromptTemplate
 from unstructured.documents.elements import (
     Text,
@@ -9,20 +9,54 @@ from unstructured.documents.elements import (
 )
 
 import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from langchain_huggingface import ChatHuggingFace, HuggingFaceEndpoint
+from model_registry import get_chat_llm
+from loadingandcleaning.summary_cache import SummaryCache, summary_key
+from loadingandcleaning.spatial_index import PageSpatialIndex, index_for
 
 
 load_dotenv()
 
 # ================= MODEL =================
-endpoint = HuggingFaceEndpoint(
-    repo_id="Qwen/Qwen2.5-7B-Instruct",
-    task="text-generation",
-    temperature=0.2,
-)
+MODEL_ID = "Qwen/Qwen2.5-7B-Instruct"
+
+def get_llm():
+    """Summarization LLM, created on first use and shared via model_registry."""
+    return get_chat_llm(
+        MODEL_ID,
+        task="text-generation",
+        temperature=0.2,
+    )
+
+
+# ================= CONCURRENCY CONFIG =================
+MAX_IN_FLIGHT = int(os.getenv("SUMMARY_MAX_IN_FLIGHT", "4"))       # 1 → serial
+RATE_PER_SEC = float(os.getenv("SUMMARY_RATE_PER_SEC", "2"))       # token refill rate
+RATE_BURST = int(os.getenv("SUMMARY_RATE_BURST", "4"))             # bucket size
+MAX_RETRIES = 3
+BACKOFF_BASE_SEC = 1.0
+BACKOFF_MAX_SEC = 30.0
+
+
+# ================= SHARED POOL =================
+# one long-lived pool per size, shared by every call (and every ingestion
+# job) instead of a new ThreadPoolExecutor per page / batch
+_pools: Dict[int, ThreadPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
 
-llm = ChatHuggingFace(llm=endpoint)
+def get_summary_pool(max_in_flight: int = MAX_IN_FLIGHT) -> ThreadPoolExecutor:
+    workers = max(max_in_flight, 1)
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="summary")
+            _pools[workers] = pool
+        return pool
 
 
 # ================= PROMPTS =================
@@ -73,17 +107,34 @@ def is_valid_text(text: str) -> bool:
     return " " in text
 
 
-def collect_image_context(elements: List, img_index: int) -> str:
+def _neighbours(elements: List, img_index: int, index: Optional[PageSpatialIndex]):
+    """
+    (elements before the image nearest first, elements after it).
+    With a spatial index and coordinates: by vertical position;
+    otherwise by list position.
+    """
+    if index is not None:
+        img_top, _ = index.y_bounds(img_index)
+        if img_top is not None:
+            return (
+                [elements[i] for i in index.above(img_top)],
+                [elements[i] for i in index.below(img_top)],
+            )
+
+    return elements[img_index - 1::-1] if img_index else [], elements[img_index + 1:]
+
+
+def collect_image_context(elements: List, img_index: int, index: Optional[PageSpatialIndex] = None) -> str:
     """
     Collect nearby text for image context.
     Priority:
     FigureCaption > NarrativeText > Text > Title/Header
     """
     context_parts = []
+    before, after = _neighbours(elements, img_index, index)
 
     # Look backward
-    for i in range(img_index - 1, max(img_index - 6, -1), -1):
-        el = elements[i]
+    for el in before[:5]:
 
         if isinstance(el, (Image, Table)):
             break
@@ -100,8 +151,7 @@ def collect_image_context(elements: List, img_index: int) -> str:
                 context_parts.insert(0, el.text)
 
     # Look forward
-    for i in range(img_index + 1, min(img_index + 4, len(elements))):
-        el = elements[i]
+    for el in after[:3]:
 
         if isinstance(el, (Image, Table)):
             break
@@ -120,53 +170,168 @@ def collect_image_context(elements: List, img_index: int) -> str:
     return normalize(" ".join(context_parts))
 
 
+# ================= LLM CALLS =================
+class TokenBucket:
+    """Thread-safe token bucket: at most `rate` calls/sec, bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity,
+                    self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+
+rate_limiter = TokenBucket(RATE_PER_SEC, RATE_BURST)
+_summary_cache = None
+_summary_cache_lock = threading.Lock()
+
+
+def get_summary_cache() -> SummaryCache:
+    # opened on first use → importing this module does not touch the disk
+    global _summary_cache
+    with _summary_cache_lock:
+        if _summary_cache is None:
+            _summary_cache = SummaryCache()
+        return _summary_cache
+
+
+def summarize(prompt: str) -> str:
+    """One rate-limited LLM call, retried with exponential backoff + jitter."""
+    for attempt in range(MAX_RETRIES + 1):
+        rate_limiter.acquire()
+        try:
+            raw = get_llm().invoke(prompt)
+            return getattr(raw, "content", raw).strip()
+        except Exception as e:
+            if attempt == MAX_RETRIES:
+                raise
+
+            delay = min(BACKOFF_MAX_SEC, BACKOFF_BASE_SEC * 2 ** attempt)
+            delay *= 0.5 + random.random()
+            print(f"⚠️ Summary call failed ({e}), retry {attempt + 1} in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def cached_summarize(template: PromptTemplate, input_text: str) -> str:
+    """summarize(), skipped entirely when this exact input was summarized before."""
+    key = summary_key(template.template, MODEL_ID, input_text)
+
+    summary = get_summary_cache().get(key)
+    if summary is not None:
+        return summary
+
+    summary = summarize(template.format(**{template.input_variables[0]: input_text}))
+    get_summary_cache().put(key, summary)
+    return summary
+
+
 # ================= MAIN RESOLVER =================
+def _summary_requests(elements: List, index: Optional[PageSpatialIndex] = None) -> Dict[int, tuple]:
+    """{element index: (prompt template, input text)} for every table / image."""
+    requests = {}
+
+    for idx, el in enumerate(elements):
+
+        # ---------- TABLE ----------
+        if isinstance(el, Table) and el.text:
+            requests[idx] = (TABLE_PROMPT, el.text)
+
+        # ---------- IMAGE ----------
+        elif isinstance(el, Image):
+            requests[idx] = (IMAGE_PROMPT, collect_image_context(elements, idx, index))
+
+    return requests
+
+
 def resolve_pages_with_summaries(
     pages: Dict[int, List],
-    
+    on_page=None,
+    max_in_flight: int = MAX_IN_FLIGHT,
+    indexes: Optional[Dict[int, PageSpatialIndex]] = None,
 ) -> Dict[int, List]:
+    """
+    Replace every table / image with a Text summary.
+
+    Summaries for all pages are requested up front on the shared pool of
+    `max_in_flight` threads (cached, rate limited + retried, see
+    cached_summarize()), then written back into their original element
+    positions, page by page. Pass several pages per call so their
+    requests overlap; identical requests within a call share one LLM
+    call (the summary cache only catches them once the first finished).
 
-    resolved_pages = {}
+    indexes (see spatial_index) → image context is taken from the
+    elements vertically around the image.
+    """
+    pool = get_summary_pool(max_in_flight)
+    submitted = {}      # (template, input text) → future
 
-    for page_num, elements in pages.items():
-        resolved_elements = []
+    try:
+        pending = {}
 
-        for idx, el in enumerate(elements):
+        for page_num, elements in pages.items():
+            pending[page_num] = {}
 
-            # ---------- TABLE ----------
-            if isinstance(el, Table) and el.text:
-                prompt = TABLE_PROMPT.format(table=el.text)
-                #summary = llm.invoke(prompt).content.strip()
-                summary = llm.invoke(prompt).strip()
-                print('table-summary idx:',idx,"\n",summary)
-                resolved_elements.append(
-                    Text(
-                        text=summary,
-                        metadata=el.metadata
-                    )
-                )
-                continue
+            page_index = index_for(indexes, page_num, elements) if indexes else None
+
+            for idx, (template, input_text) in _summary_requests(elements, page_index).items():
+                key = (template.template, input_text)
+                if key not in submitted:
+                    submitted[key] = pool.submit(cached_summarize, template, input_text)
+                pending[page_num][idx] = submitted[key]
+
+        resolved_pages = {}
 
-            # ---------- IMAGE ----------
-            if isinstance(el, Image):
-                context = collect_image_context(elements, idx)
+        for page_num, elements in pages.items():
+            resolved_elements = []
 
-                prompt = IMAGE_PROMPT.format(context=context)
-                summary = llm.invoke(prompt).content.strip()
-                #summary = llm.invoke(prompt).strip()
-                print('image-summary idx:',idx,'\n',summary)
+            for idx, el in enumerate(elements):
+                future = pending[page_num].get(idx)
+
+                # ---------- NORMAL TEXT ----------
+                if future is None:
+                    resolved_elements.append(el)
+                    continue
+
+                # ---------- TABLE / IMAGE ----------
+                summary = future.result()
+                print(f'{el.category.lower()}-summary idx:',idx,"\n",summary)
                 resolved_elements.append(
                     Text(
                         text=summary,
                         metadata=el.metadata
                     )
                 )
-                continue
 
-            # ---------- NORMAL TEXT ----------
-            resolved_elements.append(el)
+            resolved_pages[page_num] = resolved_elements
+            print("resolved page-num",page_num)
+
+            if on_page:
+                on_page(len(resolved_pages))
+    except BaseException:
+        # the pool is shared → only drop this call's queued requests
+        for future in submitted.values():
+            future.cancel()
+        raise
 
-        resolved_pages[page_num] = resolved_elements
-        print("resolved page-num",page_num)
     print("resolved both")
+    print("summary cache", get_summary_cache().stats())
     return resolved_pages
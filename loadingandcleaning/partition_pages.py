@@ -1,18 +1,41 @@
 
     # %%
 
-from unstructured.partition.pdf import partition_pdf
 from unstructured.documents.elements import Element, Text, Image, FigureCaption
 from pypdf import PdfReader, PdfWriter
 from io import BytesIO
 from PIL import Image as PILImage
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterator, Optional, Tuple, Union
 import base64
 import os
 import re
 
+from loadingandcleaning.blob_store import ENABLED as BLOB_STORE_ENABLED, spill_image_payload
+
 base_dir = "../engine.pdf"
 pdfPages = "../pdfPages"
 
+# partition_pdf is CPU-bound layout/OCR work → one process per page
+PARTITION_WORKERS = int(os.getenv("PARTITION_WORKERS", "1"))
+# seconds one page may take in a worker before it is recorded as failed
+# and the pool is restarted (0 → no limit)
+PARTITION_PAGE_TIMEOUT = float(os.getenv("PARTITION_PAGE_TIMEOUT", "600"))
+
+# "auto" → fast only for plain-text pages: a text layer, no image
+#          XObjects and no ruled (table-like) drawing; everything else hi_res.
+#          Table structure and image blocks are only extracted by hi_res,
+#          so borderless tables on a "fast" page come out as flat text.
+# "hi_res" / "fast" → force one strategy for every page
+PARTITION_STRATEGY = os.getenv("PARTITION_STRATEGY", "auto")
+MIN_TEXT_LAYER_CHARS = 20
+MIN_RULE_OPS = 8           # rectangles / line segments that suggest a ruled table
+
+# path-construction operators in a content stream: "x y w h re", "x y l"
+RULE_OPS = re.compile(rb"(?<![A-Za-z])(?:re|l)(?![A-Za-z])")
+
 
 def split_pdf_into_pages(input_pdf, output_dir):
     os.makedirs(output_dir, exist_ok=True)
@@ -46,18 +69,124 @@ def get_page_pdfs(folder_path):
     return [(i + 1, os.path.join(folder_path, f)) for i, f in enumerate(files)]
 
 
-def partition_pages_from_folder(folder_path,start:int,end:int):
-    page_files = get_page_pdfs(folder_path)
+def page_pdf_bytes(pdf_path: str, start: int, end: Optional[int] = None) -> Iterator[Tuple[int, bytes]]:
+    """
+    Yield (page_num, single-page PDF bytes) for pages [start:end]
+    of one PDF, built in memory → no per-page temp files.
+    """
+    reader = PdfReader(pdf_path)
+    total_pages = len(reader.pages)
+    end = total_pages if end is None else min(end, total_pages)
 
-    # ✅ CHANGE: dict instead of list
-    partitioned_pages = {}
+    for i in range(start, end):
+        writer = PdfWriter()
+        writer.add_page(reader.pages[i])
+
+        buf = BytesIO()
+        writer.write(buf)
+
+        yield i + 1, buf.getvalue()
+
+
+def count_pages(path: str) -> int:
+    """Page count of a PDF file, or of a folder of page PDFs."""
+    if os.path.isdir(path):
+        return len(get_page_pdfs(path))
+    return len(PdfReader(path).pages)
+
+
+def _open_source(page_source: Union[str, bytes]):
+    if isinstance(page_source, bytes):
+        return BytesIO(page_source)
+    return page_source
+
+
+def has_text_layer(page_source: Union[str, bytes]) -> bool:
+    """True if pypdf can extract real text from the page (not a scan)."""
+    try:
+        reader = PdfReader(_open_source(page_source))
+        text = "".join(page.extract_text() or "" for page in reader.pages)
+    except Exception:
+        return False
+
+    return len(text.strip()) >= MIN_TEXT_LAYER_CHARS
+
+
+def _has_image_xobject(resources, depth: int = 0) -> bool:
+    """Image XObjects on the page, including inside form XObjects."""
+    if resources is None or depth > 3:
+        return False
+
+    xobjects = resources.get_object().get("/XObject")
+    if xobjects is None:
+        return False
 
-    for page_num, base_dir in page_files[start:end]:
-        print(f"🔍 Partitioning page {page_num}")
+    for ref in xobjects.get_object().values():
+        xobject = ref.get_object()
+        subtype = xobject.get("/Subtype")
+        if subtype == "/Image":
+            return True
+        if subtype == "/Form" and _has_image_xobject(xobject.get("/Resources"), depth + 1):
+            return True
+
+    return False
+
+
+def _rule_op_count(page) -> int:
+    contents = page.get_contents()
+    if contents is None:
+        return 0
+    return len(RULE_OPS.findall(contents.get_data()))
+
+
+def needs_hi_res(page_source: Union[str, bytes]) -> bool:
+    """
+    True for pages fast partitioning would lose: scans (no text layer),
+    pages with embedded images and pages with ruled / table-like drawing.
+    """
+    if not has_text_layer(page_source):
+        return True
+
+    try:
+        reader = PdfReader(_open_source(page_source))
+        for page in reader.pages:
+            if _has_image_xobject(page.get("/Resources")):
+                return True
+            if _rule_op_count(page) >= MIN_RULE_OPS:
+                return True
+    except Exception:
+        return True
+
+    return False
+
+
+def choose_strategy(page_source: Union[str, bytes], strategy: str = PARTITION_STRATEGY) -> str:
+    if strategy != "auto":
+        return strategy
+    return "hi_res" if needs_hi_res(page_source) else "fast"
+
+
+def partition_page(page_num: int, page_source: Union[str, bytes], strategy: str = PARTITION_STRATEGY):
+    """
+    Partition one page PDF, given as a file path or in-memory bytes.
+    Returns (page_num, elements, error) so a failing page never
+    aborts the whole document.
+    """
+    # imported here: partition_pdf pulls in the layout/OCR stack, which
+    # the web process should not pay for at import time
+    from unstructured.partition.pdf import partition_pdf
+
+    try:
+        page_strategy = choose_strategy(page_source, strategy)
+
+        if isinstance(page_source, bytes):
+            source_kwargs = {"file": BytesIO(page_source)}
+        else:
+            source_kwargs = {"filename": page_source}
 
         raw_chunks = partition_pdf(
-            filename=base_dir,
-            stategy="hi_res",
+            **source_kwargs,
+            strategy=page_strategy,
             include_page_break=True,
             include_image_element=True,
             infer_table_structure=True,
@@ -65,15 +194,214 @@ def partition_pages_from_folder(folder_path,start:int,end:int):
             extract_image_block_to_payload=True,
             chunking_strategy=None,
         )
+    except Exception as e:
+        return page_num, [], f"{type(e).__name__}: {e}"
+
+    # audit trail: which strategy produced these elements
+    for el in raw_chunks:
+        el.metadata.partition_strategy = page_strategy
+
+        # image / table crops go to disk here (in the worker), elements
+        # only carry metadata.image_ref from now on
+        if BLOB_STORE_ENABLED:
+            spill_image_payload(el)
+
+    return page_num, raw_chunks, None
+
+
+def _kill_pool(pool: ProcessPoolExecutor):
+    """Shut a pool down without waiting for hung / crashed workers."""
+    # no public API before 3.14 (terminate_workers) → stop the processes directly
+    for process in list((getattr(pool, "_processes", None) or {}).values()):
+        process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _iter_partitioned(page_sources, workers: int, strategy: str, timeout: float = PARTITION_PAGE_TIMEOUT):
+    if workers <= 1:
+        for page_num, page_source in page_sources:
+            print(f"🔍 Partitioning page {page_num}")
+            yield partition_page(page_num, page_source, strategy)
+        return
+
+    print(f"🔍 Partitioning on {workers} processes")
+    pool = ProcessPoolExecutor(max_workers=workers)
+
+    # bounded window of in-flight pages, drained in submission order
+    # → page order is preserved and memory does not grow with page count
+    # entries: [page_num, page_source, future or None (not submitted yet)]
+    in_flight = deque()
+    # pages that were in flight when a worker died: one of them killed it,
+    # so they are re-run one at a time until they are all through
+    suspects = set()
+
+    def run(entry):
+        try:
+            entry[2] = pool.submit(partition_page, entry[0], entry[1], strategy)
+        except BrokenProcessPool as e:
+            # broke before we noticed → handled when this page is drained
+            entry[2] = Future()
+            entry[2].set_exception(e)
+
+    def restart(reason):
+        nonlocal pool
+        print(f"⚠️ Restarting partition pool ({reason})")
+        _kill_pool(pool)
+        pool = ProcessPoolExecutor(max_workers=workers)
+        for entry in in_flight:
+            entry[2] = None
+            if not suspects:
+                run(entry)
+
+    def next_result():
+        while True:
+            entry = in_flight[0]
+            page_num = entry[0]
+            if entry[2] is None:
+                run(entry)
+
+            try:
+                result = entry[2].result(timeout=timeout if timeout > 0 else None)
+            except FutureTimeout:
+                in_flight.popleft()
+                suspects.discard(page_num)
+                restart(f"page {page_num} timed out")
+                return page_num, [], f"Timeout: no result after {timeout:.0f}s"
+            except BrokenProcessPool as e:
+                if page_num in suspects:
+                    # it ran alone → this page is what kills the worker
+                    in_flight.popleft()
+                    suspects.discard(page_num)
+                    restart(f"worker died on page {page_num}")
+                    return page_num, [], f"BrokenProcessPool: {e}"
+
+                suspects.update(p for p, _, _ in in_flight)
+                restart(f"worker died, re-running pages {sorted(suspects)} one at a time")
+                continue
+            except Exception as e:
+                # pickling / submission errors: fail only this page
+                result = page_num, [], f"{type(e).__name__}: {e}"
+
+            in_flight.popleft()
+            suspects.discard(page_num)
+            if not suspects:
+                for waiting in in_flight:
+                    if waiting[2] is None:
+                        run(waiting)
+            return result
+
+    try:
+        for page_num, page_source in page_sources:
+            entry = [page_num, page_source, None]
+            in_flight.append(entry)
+            if not suspects:
+                run(entry)
+
+            if len(in_flight) >= workers * 2:
+                yield next_result()
+
+        while in_flight:
+            yield next_result()
+    except BaseException:
+        # error or consumer stopped early → do not wait for running pages
+        _kill_pool(pool)
+        raise
+
+    pool.shutdown()
+
+
+def _collect_partitioned(page_sources, on_page, workers, errors, strategy):
+    # ✅ CHANGE: dict instead of list
+    partitioned_pages = {}
 
+    for page_num, raw_chunks, error in _iter_partitioned(page_sources, workers, strategy):
         # ✅ CHANGE: page_num → raw_chunks
         partitioned_pages[page_num] = raw_chunks
 
-        print(f"✅ Page {page_num} partitioned ({len(raw_chunks)} elements)")
+        if error:
+            print(f"❌ Page {page_num} failed: {error}")
+            if errors is not None:
+                errors[page_num] = error
+        else:
+            strategy_used = raw_chunks[0].metadata.partition_strategy if raw_chunks else strategy
+            print(f"✅ Page {page_num} partitioned ({len(raw_chunks)} elements, {strategy_used})")
+
+        if on_page:
+            on_page(len(partitioned_pages))
 
     return partitioned_pages
 
 
+def partition_pages_from_folder(
+    folder_path,
+    start:int,
+    end:int,
+    on_page=None,
+    workers: int = PARTITION_WORKERS,
+    errors: Optional[Dict[int, str]] = None,
+    strategy: str = PARTITION_STRATEGY,
+):
+    """
+    Partition page PDFs [start:end] of folder_path.
+
+    workers > 1 spreads pages over a process pool; a page that kills its
+    worker or runs past PARTITION_PAGE_TIMEOUT is recorded as failed and
+    the pool restarted.
+    strategy "auto" probes each page's text layer (see choose_strategy).
+    Failed pages map to [] and their error is stored in `errors`
+    (if given) instead of raising.
+    """
+    page_files = get_page_pdfs(folder_path)
+
+    return _collect_partitioned(page_files[start:end], on_page, workers, errors, strategy)
+
+
+def partition_pages_from_pdf(
+    pdf_path: str,
+    start: int,
+    end: Optional[int] = None,
+    on_page=None,
+    workers: int = PARTITION_WORKERS,
+    errors: Optional[Dict[int, str]] = None,
+    strategy: str = PARTITION_STRATEGY,
+):
+    """
+    Same as partition_pages_from_folder, but pages [start:end] are cut
+    straight out of one PDF into BytesIO buffers (end=None → last page).
+    """
+    page_sources = page_pdf_bytes(pdf_path, start, end)
+
+    return _collect_partitioned(page_sources, on_page, workers, errors, strategy)
+
+
+def iter_partitioned_pages(
+    path: str,
+    start: int,
+    end: Optional[int] = None,
+    workers: int = PARTITION_WORKERS,
+    errors: Optional[Dict[int, str]] = None,
+    strategy: str = PARTITION_STRATEGY,
+) -> Iterator[Tuple[int, list]]:
+    """
+    Streaming variant: yield (page_num, elements) one page at a time.
+    path may be a single PDF or a folder of page PDFs.
+    """
+    if os.path.isdir(path):
+        page_sources = get_page_pdfs(path)[start:end]
+    else:
+        page_sources = page_pdf_bytes(path, start, end)
+
+    for page_num, raw_chunks, error in _iter_partitioned(page_sources, workers, strategy):
+        if error:
+            print(f"❌ Page {page_num} failed: {error}")
+            if errors is not None:
+                errors[page_num] = error
+        else:
+            print(f"✅ Page {page_num} partitioned ({len(raw_chunks)} elements)")
+
+        yield page_num, raw_chunks
+
+
 """ partitioned_pages = partition_pages_from_folder(pdfPages,4,10)
 
 
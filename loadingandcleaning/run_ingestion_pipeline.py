@@ -3,12 +3,31 @@ End-to-end ingestion pipeline
 Runs on a page range and prepares data for vector DB
 """
 
-from loadingandcleaning.header_footer_cleaner import clean_headers_footers_range
-from loadingandcleaning.image_filter import filter_images_per_page
+import hashlib
+import os
+from typing import Iterator, Optional, Tuple
+
+from collections import deque
+
+from loadingandcleaning.header_footer_cleaner import (
+    clean_headers_footers_range,
+    detect_headers_footers,
+    remove_headers_footers,
+)
+from loadingandcleaning.image_filter import DROP_DECORATIVE_REPEATS, ImageGroups, filter_images_per_page
 from loadingandcleaning.table_spillover import process_table_spillover
 from loadingandcleaning.page_resolver_with_summaries import resolve_pages_with_summaries
 from loadingandcleaning.vector_store_builder import store_pages_in_vector_db
-from loadingandcleaning.partition_pages import partition_pages_from_folder
+from loadingandcleaning.spatial_index import PageSpatialIndex, build_spatial_indexes
+from loadingandcleaning.columnar_page import to_columnar, to_element_pages
+from loadingandcleaning.blob_store import prune_blobs
+from loadingandcleaning.partition_pages import (
+    partition_pages_from_folder,
+    partition_pages_from_pdf,
+    count_pages,
+    get_page_pdfs,
+    iter_partitioned_pages,
+)
 from loadingandcleaning.debuggerview import debugger
 from loadingandcleaning.debugger2 import debugger as debugger2
 
@@ -19,21 +38,98 @@ START_PAGE = 0
 END_PAGE = 1
 CHROMA_DIR = "./chroma_store"
 
+# streaming mode
+STREAMING = os.getenv("INGEST_STREAMING", "1") == "1"
+HEADER_SAMPLE_PAGES = 20   # pages buffered up front for header/footer detection
+EMBED_BATCH_PAGES = 8      # pages per Chroma flush
+
+# run_pipeline: carry pages through the cleaning stages as ColumnarPage
+# (parallel arrays) instead of Element lists → far fewer live objects
+COLUMNAR = os.getenv("INGEST_COLUMNAR", "0") == "1"
+
+
+# ================= HELPERS =================
+def document_id_for(path: str) -> str:
+    """
+    Default document id: a hash of the PDF bytes (or of the page PDFs of
+    a folder). Re-uploading the same file maps onto the same vector ids;
+    different files never collide, whatever their names.
+    Pass an explicit document_id to make a revised manual replace its
+    previous version.
+    """
+    files = [p for _, p in get_page_pdfs(path)] if os.path.isdir(path) else [path]
+    h = hashlib.sha256()
+
+    for file_path in files:
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+
+    return h.hexdigest()[:16]
+
+
+def _stage_reporter(progress, stage: str):
+    """Bind a progress(stage, pages_done) callback to one stage."""
+    if progress is None:
+        return None
+    return lambda pages_done: progress(stage, pages_done)
+
 
 # ================= PIPELINE =================
-def run_pipeline(pdf_path: str, start_page: int, end_page: int):
+def run_pipeline(
+    pdf_path: str,
+    start_page: int,
+    end_page: Optional[int] = None,
+    progress=None,
+    document_id: Optional[str] = None,
+):
+    """
+    pdf_path: a single PDF, or a folder of one-PDF-per-page files
+    end_page: None → ingest through the last page
+    document_id: defaults to document_id_for(pdf_path)
+
+    progress: optional callable(stage, pages_done) where stage is one of
+    "partitioned", "partition_failed", "summarized", "embedded".
+    """
+    partition_errors = {}
+
+    if end_page is None:
+        end_page = count_pages(pdf_path)
+
+    partition = partition_pages_from_folder if os.path.isdir(pdf_path) else partition_pages_from_pdf
+
+    partitioned_pages = partition(
+        pdf_path,
+        start_page,
+        end_page,
+        on_page=_stage_reporter(progress, "partitioned"),
+        errors=partition_errors,
+    )
+
+    if partition_errors:
+        print(f"⚠️ {len(partition_errors)} page(s) failed to partition:", sorted(partition_errors))
+        if progress:
+            progress("partition_failed", len(partition_errors))
 
-    partitioned_pages = partition_pages_from_folder(pdf_path,start_page,end_page)
     """ debugger(partitioned_pages) """
     print(f"🚀 Starting ingestion for pages {start_page}–{end_page}")
 
     # 1️⃣ Header / Footer removal
     print("🧹 Removing headers & footers...")
 
+    if COLUMNAR:
+        # boxes live in the columnar pages themselves
+        partitioned_pages = to_columnar(partitioned_pages)
+        spatial_indexes = None
+    else:
+        # element geometry parsed once, shared by the cleaning stages
+        spatial_indexes = build_spatial_indexes(partitioned_pages)
+
     cleaned_pages = clean_headers_footers_range(
         partitioned_pages=partitioned_pages,
         start_page=start_page,
         end_page=end_page,
+        indexes=spatial_indexes,
     )
 
     print('cleaned_pages',cleaned_pages)
@@ -45,39 +141,192 @@ def run_pipeline(pdf_path: str, start_page: int, end_page: int):
 
     # 2️⃣ Image filtering
     print("🖼️ Filtering useless images...")
-    image_filtered_pages = filter_images_per_page(cleaned_pages)
+    image_groups = ImageGroups() if DROP_DECORATIVE_REPEATS else None
+    image_filtered_pages = filter_images_per_page(cleaned_pages, groups=image_groups)
+    if image_groups is not None:
+        print("🖼️ Image groups:", image_groups.stats())
 
     
     # 3️⃣ Table spillover resolution
     print("📊 Resolving table spillover...")
-    table_processed_pages = process_table_spillover(image_filtered_pages)
+    table_processed_pages = process_table_spillover(image_filtered_pages, indexes=spatial_indexes)
 
     print('table_processed_pages',table_processed_pages)
     #debugger(table_processed_pages)
 
     
 
+    if COLUMNAR:
+        # the resolver builds Text elements → back to Element lists here
+        table_processed_pages = to_element_pages(table_processed_pages)
+        spatial_indexes = build_spatial_indexes(table_processed_pages)
+
     # 4️⃣ Page resolution + summaries
     print("🧠 Resolving pages & generating summaries...")
     resolved_pages = resolve_pages_with_summaries(
-        pages=table_processed_pages
-        
+        pages=table_processed_pages,
+        on_page=_stage_reporter(progress, "summarized"),
+        indexes=spatial_indexes,
     )
 
     print('resolved_pages',resolved_pages)
     #debugger(resolved_pages)
 
+    # a page that failed to partition is [] here; storing it would delete
+    # its previously indexed chunks as "stale"
+    resolved_pages = {
+        page_num: elements
+        for page_num, elements in resolved_pages.items()
+        if page_num not in partition_errors
+    }
+
     # 5️⃣ Store in vector DB
     print("🧬 Storing pages in vector database...")
     vectorstore = store_pages_in_vector_db(
         resolved_pages=resolved_pages,
-        persist_dir=CHROMA_DIR
+        persist_dir=CHROMA_DIR,
+        document_id=document_id or document_id_for(pdf_path),
     )
 
+    if progress:
+        progress("embedded", len(resolved_pages))
+
+    # crops were only needed by the stages above
+    prune_blobs()
+
     print("✅ Ingestion complete")
     return vectorstore
 
 
+# ================= STREAMING PIPELINE =================
+def _replay_sample(sample: deque, rest: Iterator) -> Iterator[Tuple[int, list]]:
+    """Yield the buffered sample pages first (releasing them), then the rest."""
+    while sample:
+        yield sample.popleft()
+    yield from rest
+
+
+def run_pipeline_streaming(
+    pdf_path: str,
+    start_page: int,
+    end_page: Optional[int] = None,
+    progress=None,
+    batch_pages: int = EMBED_BATCH_PAGES,
+    header_sample_pages: int = HEADER_SAMPLE_PAGES,
+    document_id: Optional[str] = None,
+):
+    """
+    Page-at-a-time version of run_pipeline.
+
+    - headers/footers are detected once on the first `header_sample_pages`
+    - the cheap page-local stages run one page at a time
+    - every `batch_pages` cleaned pages are summarized together (their
+      LLM calls overlap on the shared pool) and flushed to Chroma
+
+    Peak memory is bounded by the sample + one batch, not by page count,
+    and pages become searchable as soon as their batch is flushed.
+    """
+    partition_errors = {}
+    document_id = document_id or document_id_for(pdf_path)
+    pages = iter_partitioned_pages(pdf_path, start_page, end_page, errors=partition_errors)
+
+    print(f"🚀 Streaming ingestion for pages {start_page}–{end_page}")
+
+    # 1️⃣ Header / Footer detection on a leading sample
+    sample = deque()
+    for page in pages:
+        sample.append(page)
+        if len(sample) >= header_sample_pages:
+            break
+
+    if len(sample) < 3:
+        print("⚠️ Warning: Header/footer detection works best with ≥3 pages")
+
+    # element geometry parsed once per page; sample pages keep theirs
+    # until they are replayed through the page-local stages
+    spatial_indexes = build_spatial_indexes(dict(sample))
+
+    headers, footers = detect_headers_footers(dict(sample), spatial_indexes)
+    print(f"🧹 Headers detected: {len(headers)}")
+    print(f"🧹 Footers detected: {len(footers)}")
+
+    pages_partitioned = 0
+    pages_summarized = 0
+    pages_embedded = 0
+    batch = {}
+    batch_indexes = {}
+    vectorstore = None
+
+    # near-duplicate image groups (decorative repeats), shared by all pages
+    image_groups = ImageGroups() if DROP_DECORATIVE_REPEATS else None
+
+    def on_summarized(done_in_batch):
+        if progress:
+            progress("summarized", pages_summarized + done_in_batch)
+
+    def flush():
+        nonlocal vectorstore, pages_summarized, pages_embedded
+
+        # 4️⃣ Table / image summaries for the whole batch at once
+        resolved = resolve_pages_with_summaries(
+            pages=batch,
+            on_page=on_summarized,
+            indexes=batch_indexes,
+        )
+        pages_summarized += len(resolved)
+
+        # 5️⃣ Store in vector DB
+        print(f"🧬 Flushing {len(resolved)} pages to vector database...")
+        vectorstore = store_pages_in_vector_db(
+            resolved_pages=resolved,
+            persist_dir=CHROMA_DIR,
+            document_id=document_id,
+        )
+        pages_embedded += len(resolved)
+        batch.clear()
+        batch_indexes.clear()
+        if progress:
+            progress("embedded", pages_embedded)
+
+    # 2️⃣ – 3️⃣ Cheap page-local stages, one page at a time
+    for page_num, elements in _replay_sample(sample, pages):
+        pages_partitioned += 1
+        if progress:
+            progress("partitioned", pages_partitioned)
+
+        # failed page → keep whatever is already indexed for it
+        if page_num in partition_errors:
+            if progress:
+                progress("partition_failed", len(partition_errors))
+            continue
+
+        page = {page_num: elements}
+        indexes = {page_num: spatial_indexes.pop(page_num, None) or PageSpatialIndex(elements)}
+
+        page = remove_headers_footers(page, headers, footers)
+        page = filter_images_per_page(page, groups=image_groups)
+        page = process_table_spillover(page, indexes=indexes)
+
+        batch.update(page)
+        batch_indexes.update(indexes)
+        if len(batch) >= batch_pages:
+            flush()
+
+    if batch:
+        flush()
+
+    if partition_errors:
+        print(f"⚠️ {len(partition_errors)} page(s) failed to partition:", sorted(partition_errors))
+        if progress:
+            progress("partition_failed", len(partition_errors))
+
+    # crops were only needed by the stages above
+    prune_blobs()
+
+    print("✅ Streaming ingestion complete")
+    return vectorstore
+
+
 # ================= RUN =================
 """ if __name__ == "__main__":
     run_pipeline(FOLDER_PATH, START_PAGE, END_PAGE)
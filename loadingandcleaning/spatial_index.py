@@ -0,0 +1,137 @@
+"""
+Per-page spatial index of element bounding boxes
+Coordinates are parsed once per page (right after partitioning) into
+numpy arrays plus a list of tops sorted for bisect, so the cleaning
+stages answer their geometry queries without rescanning the page.
+"""
+
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+# ================= HELPERS =================
+def element_box(el) -> Optional[Tuple[float, float, float, float, float]]:
+    """(x0, top, x1, bottom, first_point_y) of an element, None without coordinates."""
+    if not el.metadata or not el.metadata.coordinates:
+        return None
+
+    points = el.metadata.coordinates.points
+    xs = [p[0] for p in points]
+    ys = [p[1] for p in points]
+    return min(xs), min(ys), max(xs), max(ys), points[0][1]
+
+
+# ================= INDEX =================
+class PageSpatialIndex:
+    """
+    boxes[i] = (x0, top, x1, bottom) of elements[i], NaN without coordinates
+    first_y[i] = y of the first coordinate point (what header detection uses)
+    order = element indexes with a box, sorted by top (stable)
+    """
+
+    def __init__(self, elements: List, boxes: Optional[np.ndarray] = None, first_y: Optional[np.ndarray] = None):
+        self.elements = elements
+
+        if boxes is None:
+            raw = [element_box(el) or (np.nan,) * 5 for el in elements]
+            table = np.array(raw, dtype=np.float64).reshape(len(elements), 5)
+            boxes, first_y = table[:, :4], table[:, 4]
+
+        self.boxes = boxes
+        self.first_y = first_y
+
+        has_box = ~np.isnan(boxes[:, 1])
+        boxed = np.flatnonzero(has_box)
+        self.order = boxed[np.argsort(boxes[boxed, 1], kind="stable")]
+        self.tops = boxes[self.order, 1].tolist()
+
+        self._rows = None
+
+    # ---------- reuse across stages ----------
+    def view(self, elements: List) -> "PageSpatialIndex":
+        """
+        Index for a later version of the page (elements dropped, merged or
+        replaced by earlier stages): known elements reuse their parsed
+        boxes, only new ones are parsed.
+        """
+        if elements is self.elements:
+            return self
+
+        if self._rows is None:
+            self._rows = {id(el): i for i, el in enumerate(self.elements)}
+
+        boxes = np.full((len(elements), 4), np.nan)
+        first_y = np.full(len(elements), np.nan)
+
+        for i, el in enumerate(elements):
+            row = self._rows.get(id(el))
+            if row is not None:
+                boxes[i] = self.boxes[row]
+                first_y[i] = self.first_y[row]
+            else:
+                box = element_box(el)
+                if box is not None:
+                    boxes[i] = box[:4]
+                    first_y[i] = box[4]
+
+        return PageSpatialIndex(elements, boxes, first_y)
+
+    # ---------- queries ----------
+    def y_bounds(self, i: int) -> Tuple[Optional[float], Optional[float]]:
+        top, bottom = self.boxes[i, 1], self.boxes[i, 3]
+        if np.isnan(top):
+            return None, None
+        return float(top), float(bottom)
+
+    def inside_vertically(self, top: float, bottom: float) -> List[int]:
+        """Elements whose top lies in [top, bottom], sorted by top."""
+        lo = bisect_left(self.tops, top)
+        hi = bisect_right(self.tops, bottom)
+        return self.order[lo:hi].tolist()
+
+    def below(self, y: float) -> List[int]:
+        """Elements with top > y, nearest first."""
+        return self.order[bisect_right(self.tops, y):].tolist()
+
+    def above(self, y: float) -> List[int]:
+        """Elements with top < y, nearest first."""
+        return self.order[:bisect_left(self.tops, y)][::-1].tolist()
+
+    def bands(self, top_fraction: float, bottom_fraction: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Boolean masks of elements in the top / bottom band of the page,
+        measured on first_y between the highest and lowest element.
+        """
+        known = self.first_y[~np.isnan(self.first_y)]
+        if known.size == 0:
+            empty = np.zeros(len(self.elements), dtype=bool)
+            return empty, empty
+
+        min_y, max_y = known.min(), known.max()
+        height = max(max_y - min_y, 1)
+
+        with np.errstate(invalid="ignore"):
+            top = self.first_y <= min_y + top_fraction * height
+            bottom = ~top & (self.first_y >= max_y - bottom_fraction * height)
+
+        return top, bottom
+
+
+# ================= PUBLIC API =================
+def build_spatial_indexes(pages: Dict[int, List]) -> Dict[int, PageSpatialIndex]:
+    """{page_num: PageSpatialIndex}, built once after partitioning."""
+    return {page_num: PageSpatialIndex(elements) for page_num, elements in pages.items()}
+
+
+def index_for(
+    indexes: Optional[Dict[int, PageSpatialIndex]],
+    page_num: int,
+    elements: List,
+) -> PageSpatialIndex:
+    """The shared index for this page (as a view of `elements`), or a fresh one."""
+    index = indexes.get(page_num) if indexes else None
+    if index is None:
+        return PageSpatialIndex(elements)
+    return index.view(elements)
@@ -0,0 +1,123 @@
+"""
+Persistent, content-addressed cache for table / image summaries
+key = sha256(prompt template, model id, input text)
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+# ================= CONFIG =================
+CACHE_PATH = os.getenv("SUMMARY_CACHE_PATH", "./summary_cache.sqlite3")
+MAX_BYTES = int(float(os.getenv("SUMMARY_CACHE_MAX_MB", "64")) * 1024 * 1024)
+
+
+# ================= HELPERS =================
+def summary_key(template: str, model_id: str, input_text: str) -> str:
+    h = hashlib.sha256()
+    for part in (template, model_id, input_text):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+# ================= CACHE =================
+class SummaryCache:
+    """
+    SQLite-backed summary cache with size-based LRU eviction.
+    Safe to share between the summarization threads.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_bytes: int = MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS summaries (
+                key TEXT PRIMARY KEY,
+                summary TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_summaries_last_used ON summaries(last_used)"
+        )
+        self.conn.commit()
+
+        self.total_bytes = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM summaries"
+        ).fetchone()[0]
+
+    def get(self, key: str) -> Optional[str]:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT summary FROM summaries WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.conn.execute(
+                "UPDATE summaries SET last_used = ? WHERE key = ?",
+                (time.time(), key)
+            )
+            self.conn.commit()
+            return row[0]
+
+    def put(self, key: str, summary: str):
+        size = len(summary.encode("utf-8"))
+
+        with self.lock:
+            old = self.conn.execute(
+                "SELECT size FROM summaries WHERE key = ?", (key,)
+            ).fetchone()
+
+            self.conn.execute(
+                "INSERT OR REPLACE INTO summaries (key, summary, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, summary, size, time.time())
+            )
+            self.total_bytes += size - (old[0] if old else 0)
+
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        """Drop least-recently-used rows until under max_bytes."""
+        while self.total_bytes > self.max_bytes:
+            row = self.conn.execute(
+                "SELECT key, size FROM summaries ORDER BY last_used LIMIT 1"
+            ).fetchone()
+            if row is None:
+                break
+
+            self.conn.execute("DELETE FROM summaries WHERE key = ?", (row[0],))
+            self.total_bytes -= row[1]
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            entries = self.conn.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+        }
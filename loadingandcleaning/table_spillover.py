@@ -1,5 +1,7 @@
-from typing import Dict, List
+from typing import Dict, List, Optional
 import statistics
+from loadingandcleaning.spatial_index import PageSpatialIndex, index_for
+from loadingandcleaning.columnar_page import ColumnarPage, category_at, keep_rows, text_at
 
 # ================= CONFIG =================
 TOLERANCE = 0.12
@@ -29,31 +31,31 @@ def get_y_bounds(el):
     return min(ys), max(ys)
 
 
-def estimate_average_row_gap(table_el, page_elements):
+def estimate_average_row_gap(table_el, page_elements, index: Optional[PageSpatialIndex] = None):
+    """
+    Mean positive gap between the text rows whose top lies inside the
+    table's vertical span. index → bisect lookup instead of a page scan.
+    """
     table_top, table_bottom = get_y_bounds(table_el)
     if table_top is None:
         return None
 
-    internal_rows = []
+    if index is None:
+        index = PageSpatialIndex(page_elements)
 
-    for el in page_elements:
-        if not hasattr(el, "text"):
-            continue
-        if not el.metadata or not el.metadata.coordinates:
-            continue
+    return _row_gap(index, table_top, table_bottom)
 
-        top, bottom = get_y_bounds(el)
-        if top is None:
-            continue
 
-        if table_top <= top <= table_bottom:
-            internal_rows.append((top, bottom))
+def _row_gap(index: PageSpatialIndex, table_top, table_bottom):
+    internal_rows = [
+        index.y_bounds(i)
+        for i in index.inside_vertically(table_top, table_bottom)
+        if text_at(index.elements, i) is not None
+    ]
 
     if len(internal_rows) < 2:
         return None
 
-    internal_rows.sort(key=lambda x: x[0])
-
     gaps = []
     for i in range(len(internal_rows) - 1):
         gap = internal_rows[i + 1][0] - internal_rows[i][1]
@@ -65,9 +67,15 @@ def estimate_average_row_gap(table_el, page_elements):
 
 # ================= CORE LOGIC =================
 def process_table_spillover(
-    pages: Dict[int, List]
+    pages: Dict[int, List],
+    indexes: Optional[Dict[int, PageSpatialIndex]] = None,
 ) -> Dict[int, List]:
     """
+    indexes: optional spatial indexes (see spatial_index)
+
+    pages values may be element lists or ColumnarPage; the result keeps
+    the same form.
+
     Returns:
     {
       page_number: [elements]
@@ -82,26 +90,29 @@ def process_table_spillover(
     processed_pages = {}
 
     for page_num, elements in pages.items():
+        if isinstance(elements, ColumnarPage):
+            index = elements.spatial_index()
+        else:
+            index = index_for(indexes, page_num, elements)
+
         used_indices = set()
-        updated_elements = list(elements)
+        merged_texts = {}
 
         i = 0
         while i < len(elements):
-            el = elements[i]
-
             # Structural trigger
-            if el.category != "Table":
+            if category_at(elements, i) != "Table":
                 i += 1
                 continue
 
-            table_top, table_bottom = get_y_bounds(el)
+            table_top, table_bottom = index.y_bounds(i)
             if table_top is None:
                 i += 1
                 continue
 
-            collected_texts = [el.text.strip()]
+            collected_texts = [text_at(elements, i).strip()]
 
-            avg_gap = estimate_average_row_gap(el, elements)
+            avg_gap = _row_gap(index, table_top, table_bottom)
             spillover_limit = avg_gap * (1 + TOLERANCE) if avg_gap else 0
 
             current_bottom = table_bottom
@@ -109,17 +120,15 @@ def process_table_spillover(
 
             # ---- ITERATIVE SPILLOVER ----
             while j < len(elements):
-                next_el = elements[j]
-
                 # Order + Type rule
-                if next_el.category != "UncategorizedText":
+                if category_at(elements, j) != "UncategorizedText":
                     break
 
-                text = (next_el.text or "").strip()
+                text = (text_at(elements, j) or "").strip()
                 if not is_valid_text(text):
                     break
 
-                next_top, next_bottom = get_y_bounds(next_el)
+                next_top, next_bottom = index.y_bounds(j)
                 if next_top is None:
                     break
 
@@ -133,16 +142,15 @@ def process_table_spillover(
                 j += 1
 
             # 🔥 Merge into SAME Table element
-            el.text = "\n".join(collected_texts)
+            merged_texts[i] = "\n".join(collected_texts)
 
             i = j
 
         # Remove spillover elements ONLY
-        cleaned_elements = [
-            el for idx, el in enumerate(updated_elements)
-            if idx not in used_indices
-        ]
-
-        processed_pages[page_num] = cleaned_elements
+        processed_pages[page_num] = keep_rows(
+            elements,
+            [idx for idx in range(len(elements)) if idx not in used_indices],
+            texts=merged_texts,
+        )
 
     return processed_pages
@@ -1,16 +1,17 @@
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_chroma import Chroma
 from langchain_core.documents import Document
+import hashlib
 import os
+import uuid
+from typing import List, Tuple
 from dotenv import load_dotenv
+from model_registry import get_vectorstore, get_lexical_index
+from loadingandcleaning.columnar_page import text_at
 
 load_dotenv()
 
 
 # ---------- Embedding model ----------
-embeddings = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2"
-)
+# shared with retrieval, loaded on first use (see model_registry)
 
 
 
@@ -22,53 +23,235 @@ embeddings = HuggingFaceEmbeddings(
     model="nomic-embed-text"
 ) """
 
+# ---------- Deterministic ids ----------
+DEFAULT_DOCUMENT_ID = "default"
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_id(document_id: str, page_num: int, chunk_index: int) -> str:
+    """
+    Stable id for one stored chunk. The content hash is kept in metadata
+    (not in the id) so a revised page overwrites its own chunk in place.
+    """
+    return f"{document_id}:p{page_num}:c{chunk_index}"
+
+
+def _existing_hashes(vectorstore, document_id: str, pages: list) -> dict:
+    """{id: content_hash} already stored for these pages of the document."""
+    existing = vectorstore.get(
+        where={
+            "$and": [
+                {"document_id": document_id},
+                {"page": {"$in": pages}},
+            ]
+        },
+        include=["metadatas"],
+    )
+
+    return {
+        doc_id: (meta or {}).get("content_hash")
+        for doc_id, meta in zip(existing["ids"], existing["metadatas"])
+    }
+
+
+# ---------- Chunking ----------
+# "page"     → one chunk per page (original behaviour)
+# "elements" → consecutive elements packed up to CHUNK_MAX_CHARS, with
+#              trailing elements of the previous chunk repeated as overlap
+CHUNKING = os.getenv("VECTOR_CHUNKING", "elements")
+CHUNK_MAX_CHARS = int(os.getenv("VECTOR_CHUNK_MAX_CHARS", "1000"))
+CHUNK_OVERLAP_CHARS = int(os.getenv("VECTOR_CHUNK_OVERLAP_CHARS", "150"))
+
+
+def _split_long(text: str, max_chars: int) -> List[str]:
+    """An element longer than the budget is cut into windows on whitespace."""
+    pieces = []
+    while len(text) > max_chars:
+        cut = text.rfind(" ", 0, max_chars)
+        if cut <= 0:
+            cut = max_chars
+        pieces.append(text[:cut].strip())
+        text = text[cut:].strip()
+    if text:
+        pieces.append(text)
+    return pieces
+
+
+def page_chunks(
+    elements: list,
+    mode: str = CHUNKING,
+    max_chars: int = CHUNK_MAX_CHARS,
+    overlap_chars: int = CHUNK_OVERLAP_CHARS,
+) -> List[Tuple[str, int, int]]:
+    """
+    Split one page's elements (list or ColumnarPage) into chunks, never inside an element
+    (unless the element alone is over budget).
+    Returns [(text, element_start, element_end)], offsets are indexes
+    into `elements`, inclusive.
+    """
+    items = []
+    for idx in range(len(elements)):
+        text = text_at(elements, idx)
+        if text is None:
+            continue
+
+        text = text.strip()
+        if text:
+            items.append((idx, text))
+
+    if not items:
+        return []
+
+    if mode != "elements" or max_chars <= 0:
+        return [("\n".join(t for _, t in items), items[0][0], items[-1][0])]
+
+    chunks = []
+    current = []     # [(element index, text)]
+    size = 0
+
+    def flush():
+        chunks.append(("\n".join(t for _, t in current), current[0][0], current[-1][0]))
+
+    for idx, text in items:
+        for piece in _split_long(text, max_chars):
+            if current and size + len(piece) > max_chars:
+                flush()
+
+                # overlap: repeat the trailing elements that fit the budget
+                carry = []
+                carried = 0
+                for item in reversed(current):
+                    if carried + len(item[1]) > overlap_chars:
+                        break
+                    carry.insert(0, item)
+                    carried += len(item[1]) + 1
+
+                current, size = carry, carried
+                if size + len(piece) > max_chars:
+                    current, size = [], 0
+
+            current.append((idx, piece))
+            size += len(piece) + 1
+
+    if current:
+        flush()
+
+    return chunks
+
+
+# ---------- Store generation ----------
+GENERATION_FILE = "generation"
+
+
+def store_generation(persist_dir: str) -> str:
+    """
+    Token that changes whenever documents are added to or removed from
+    the store (read by caches that must not outlive the data).
+    """
+    try:
+        with open(os.path.join(persist_dir, GENERATION_FILE)) as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def _bump_store_generation(persist_dir: str):
+    os.makedirs(persist_dir, exist_ok=True)
+    path = os.path.join(persist_dir, GENERATION_FILE)
+    tmp = f"{path}.{os.getpid()}.tmp"
+
+    with open(tmp, "w") as f:
+        f.write(uuid.uuid4().hex)
+    os.replace(tmp, path)
+
+
 # ---------- Store in Chroma ----------
 def store_pages_in_vector_db(
     resolved_pages: dict,
-    persist_dir: str = "../bhroma_store"
+    persist_dir: str = "../bhroma_store",
+    document_id: str = DEFAULT_DOCUMENT_ID,
 ):
     """
     resolved_pages format:
     {
         page_num: [elements]   # elements are Text only (tables/images resolved)
     }
+    (a ColumnarPage works in place of the element list)
+
+    Each page is split by page_chunks() (see CHUNKING); every chunk
+    keeps its page and element offsets in metadata.
+
+    Idempotent: chunks are upserted under chunk_id(), unchanged chunks
+    (same content_hash) are skipped and chunks that no longer exist on a
+    re-ingested page are deleted. The BM25 lexical index is kept in
+    step with the vector store.
     """
 
     docs = []
+    ids = []
 
     for page_num, elements in resolved_pages.items():
-        parts = []
+        for chunk_index, (text, element_start, element_end) in enumerate(page_chunks(elements)):
+            ids.append(chunk_id(document_id, page_num, chunk_index))
+            docs.append(
+                Document(
+                    page_content=text,
+                    metadata={
+                        "page": page_num,
+                        "document_id": document_id,
+                        "chunk": chunk_index,
+                        "element_start": element_start,
+                        "element_end": element_end,
+                        "content_hash": content_hash(text),
+                    }
+                )
+            )
 
-        for el in elements:
-            if not hasattr(el, "text"):
-                continue
+    vectorstore = get_vectorstore(persist_dir)
+    lexical = get_lexical_index(persist_dir)
 
-            text = el.text.strip()
-            if not text:
-                continue
+    if not resolved_pages:
+        return vectorstore
 
-            parts.append(text)
+    existing = _existing_hashes(vectorstore, document_id, list(resolved_pages))
 
-        if not parts:
-            continue
+    changed = [
+        (doc_id, doc)
+        for doc_id, doc in zip(ids, docs)
+        if existing.get(doc_id) != doc.metadata["content_hash"]
+    ]
+    new_ids = set(ids)
+    stale = [doc_id for doc_id in existing if doc_id not in new_ids]
 
-        page_content = "\n".join(parts)
+    print(
+        f"🧬 Storing {len(docs)} chunks from {len(resolved_pages)} pages in vector DB "
+        f"({len(changed)} new/changed, {len(docs) - len(changed)} unchanged, {len(stale)} stale)"
+    )
 
-        docs.append(
-            Document(
-                page_content=page_content,
-                metadata={
-                    "page": page_num
-                }
-            )
-        )
+    if stale:
+        vectorstore.delete(ids=stale)
+        lexical.delete(stale)
 
-    print(f"🧬 Storing {len(docs)} pages in vector DB")
+    if changed:
+        # add_documents upserts by id
+        vectorstore.add_documents(
+            documents=[doc for _, doc in changed],
+            ids=[doc_id for doc_id, _ in changed],
+        )
 
-    vectorstore = Chroma.from_documents(
-        documents=docs,
-        embedding=embeddings,
-        persist_directory=persist_dir
+    # changed chunks + any unchanged ones stored before the lexical index existed
+    changed_ids = {doc_id for doc_id, _ in changed}
+    unindexed = set(lexical.missing([d for d in ids if d not in changed_ids]))
+    lexical.upsert(
+        (doc_id, doc.page_content)
+        for doc_id, doc in zip(ids, docs)
+        if doc_id in changed_ids or doc_id in unindexed
     )
 
+    if stale or changed:
+        _bump_store_generation(persist_dir)
+
     return vectorstore
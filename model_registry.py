@@ -0,0 +1,132 @@
+"""
+Process-wide model registry
+Embedding models, LLM clients and the Chroma store are created lazily on
+first use and shared by every module, so importing app.py loads nothing
+heavy and each model is loaded once per process.
+"""
+
+import os
+import resource
+import threading
+import time
+from typing import Dict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ================= CONFIG =================
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+# ================= STATE =================
+_models: Dict[tuple, object] = {}
+_load_seconds: Dict[str, float] = {}
+_lock = threading.RLock()
+
+
+# ================= HELPERS =================
+def max_rss_mb() -> float:
+    """Peak resident set size of this process (Linux reports KiB)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+_rss_at_import_mb = max_rss_mb()
+
+
+def _get_or_create(key: tuple, label: str, factory):
+    model = _models.get(key)
+    if model is not None:
+        return model
+
+    with _lock:
+        model = _models.get(key)
+        if model is None:
+            started = time.perf_counter()
+            model = factory()
+            _load_seconds[label] = time.perf_counter() - started
+            _models[key] = model
+            print(f"📦 Loaded {label} in {_load_seconds[label]:.2f}s")
+
+    return model
+
+
+# ================= PUBLIC API =================
+def get_embeddings(model_name: str = EMBEDDING_MODEL):
+    """Shared, cache-backed embeddings for ingestion and queries."""
+    def factory():
+        from langchain_huggingface import HuggingFaceEmbeddings
+        from embedding_cache import CachedEmbeddings
+
+        return CachedEmbeddings(
+            HuggingFaceEmbeddings(model_name=model_name),
+            model_name=model_name,
+        )
+
+    return _get_or_create(("embeddings", model_name), f"embeddings:{model_name}", factory)
+
+
+def get_chat_llm(repo_id: str, **endpoint_kwargs):
+    """Shared ChatHuggingFace client, one per (repo_id, endpoint settings)."""
+    def factory():
+        from langchain_huggingface import ChatHuggingFace, HuggingFaceEndpoint
+
+        endpoint = HuggingFaceEndpoint(repo_id=repo_id, **endpoint_kwargs)
+        return ChatHuggingFace(llm=endpoint)
+
+    key = ("llm", repo_id, tuple(sorted(endpoint_kwargs.items())))
+    return _get_or_create(key, f"llm:{repo_id}", factory)
+
+
+def get_vectorstore(persist_dir: str, model_name: str = EMBEDDING_MODEL):
+    """Shared Chroma handle for one persist directory."""
+    def factory():
+        from langchain_chroma import Chroma
+
+        return Chroma(
+            persist_directory=persist_dir,
+            embedding_function=get_embeddings(model_name),
+        )
+
+    return _get_or_create(("chroma", persist_dir, model_name), f"chroma:{persist_dir}", factory)
+
+
+def get_lexical_index(persist_dir: str):
+    """Shared BM25 index stored alongside the Chroma store."""
+    def factory():
+        from lexical_index import LexicalIndex
+
+        os.makedirs(persist_dir, exist_ok=True)
+        return LexicalIndex(os.path.join(persist_dir, "lexical_index.sqlite3"))
+
+    return _get_or_create(("lexical", persist_dir), f"lexical:{persist_dir}", factory)
+
+
+def warmup(*loaders):
+    """
+    Eagerly run the given zero-arg loaders (e.g. output.get_llm) plus the
+    default embeddings, and embed one string so the first request is fast.
+    Returns startup_report().
+    """
+    get_embeddings().embed_query("warmup")
+
+    for loader in loaders:
+        loader()
+
+    return startup_report()
+
+
+def embedding_cache_stats() -> dict:
+    """{model name: CachedEmbeddings.stats()} for the models loaded so far (loads nothing)."""
+    with _lock:
+        loaded = [(key[1], model) for key, model in _models.items() if key[0] == "embeddings"]
+    return {model_name: model.stats() for model_name, model in loaded}
+
+
+def startup_report() -> dict:
+    return {
+        "loaded": sorted(_load_seconds),
+        "load_seconds": dict(_load_seconds),
+        "max_rss_mb_at_import": round(_rss_at_import_mb, 1),
+        "max_rss_mb_now": round(max_rss_mb(), 1),
+    }
@@ -1,12 +1,18 @@
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
 from outputschema import RAGAnswer
-from langchain_huggingface import ChatHuggingFace, HuggingFaceEndpoint
-from retrivel import retriver
+from model_registry import get_chat_llm
+from retrivel import retriver_with_scores, extract_page_numbers, referenced_pages, CHROMA_DIR
+from query_router import choose_route, record_rag_outcome, ROUTE_GENERAL
+from context_builder import build_compressed_context, build_page_context
+from answer_cache import SemanticAnswerCache, ENABLED as ANSWER_CACHE_ENABLED
 from dotenv import load_dotenv
+import re
+from typing import Optional
 from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_community.chat_message_histories import ChatMessageHistory
+from chat_history import SessionStore
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.messages import AIMessage, HumanMessage
 
 
 
@@ -16,13 +22,13 @@ load_dotenv()
 # ===============================
 # LLM SETUP
 # ===============================
-endpoint = HuggingFaceEndpoint(
-    repo_id="openai/gpt-oss-120b",
-    provider="novita",
-    temperature=0.2,
-)
-
-llm = ChatHuggingFace(llm=endpoint)
+def get_llm():
+    """Answering LLM, created on first use and shared via model_registry."""
+    return get_chat_llm(
+        "openai/gpt-oss-120b",
+        provider="novita",
+        temperature=0.2,
+    )
 
 
 """ llm = ChatOllama(
@@ -45,16 +51,46 @@ llm = ChatHuggingFace(llm=endpoint)
 # SESSION MEMORY STORE
 # ===============================
 
-session_store = {}
+history_summary_prompt = PromptTemplate(
+    input_variables=["summary", "transcript"],
+    template="""
+Update the running summary of a conversation about an engine manual.
+Keep facts, part numbers, values and open questions. Be brief.
+
+Current summary:
+{summary}
+
+New messages:
+{transcript}
+
+Updated summary:
+"""
+)
+
+
+def summarize_history(summary: str, messages) -> str:
+    """Fold older turns into the rolling conversation summary."""
+    transcript = "\n".join(f"{m.type}: {m.content}" for m in messages)
+
+    raw = get_llm().invoke(
+        history_summary_prompt.format(summary=summary or "(none)", transcript=transcript)
+    )
+    return raw.content
+
+
+session_store = SessionStore(summarize_history)
 
 def get_session_history(session_id: str):
 
-    if session_id not in session_store:
-        session_store[session_id] = ChatMessageHistory()
+    return session_store.get(session_id)
 
-    return session_store[session_id]
 
 
+# ===============================
+# ANSWER CACHE
+# ===============================
+answer_cache = SemanticAnswerCache(CHROMA_DIR)
+
 
 # ===============================
 # OUTPUT PARSER
@@ -124,6 +160,18 @@ def build_context(docs):
     )
 
 
+def rag_context(query: str, docs) -> str:
+    """
+    Verbatim text for an explicit page lookup (the user asked for exactly
+    those pages; truncated with a note past PAGE_CONTEXT_TOKEN_BUDGET),
+    query-compressed context otherwise.
+    """
+    pages = extract_page_numbers(query)
+    if pages and all(d.metadata.get("page") in pages for d in docs):
+        return build_page_context(docs, referenced_pages(query))
+    return build_compressed_context(query, docs)
+
+
 def extract_pages(docs):
     """
     Collect unique page numbers used in retrieval
@@ -136,25 +184,153 @@ def extract_pages(docs):
     return pages
 
 
+def rag_chat(session_id: Optional[str]):
+    """History-backed chain for a session; stateless (empty history) without one."""
+    if session_id is None:
+        return rag_prompt.partial(history=[]) | get_llm()
+    return rag_chat_with_memory()
+
+
+def rag_chat_with_memory():
+    """RAG prompt → LLM, with per-session chat history."""
+    rag_chain = rag_prompt | get_llm()
+
+    return RunnableWithMessageHistory(
+        rag_chain,
+        get_session_history,
+        input_messages_key="question",
+        history_messages_key="history"
+    )
+
+
+def rag_inputs(context: str, query: str) -> dict:
+    return {
+        "context": context,
+        "question": query,
+        "format_instructions": output_parser.get_format_instructions()
+    }
+
+
+def use_answer_cache(session_id: Optional[str]) -> bool:
+    """
+    Cached answers are history-free: a session that already has history
+    gets a fresh answer (and its answers are not cached for others).
+    Requests without a session are always history-free.
+    """
+    if not ANSWER_CACHE_ENABLED:
+        return False
+    return session_id is None or not get_session_history(session_id).has_history()
+
+
+def record_cached_turn(query: str, session_id: Optional[str], cached: dict):
+    """A cache hit is still a turn of this session's conversation."""
+    if session_id is None:
+        return
+    get_session_history(session_id).add_messages([
+        HumanMessage(content=query),
+        AIMessage(content=cached["answer"]),
+    ])
+
+
+def session_config(session_id: Optional[str]) -> dict:
+    if session_id is None:
+        return {}
+    return {
+        "configurable": {
+            "session_id": session_id
+        }
+    }
+
+
+class AnswerFieldStreamer:
+    """
+    The RAG LLM replies with JSON ({"answer": "...", ...}).
+    feed() takes raw streamed text and returns only the newly visible
+    characters of the "answer" string value, JSON escapes decoded.
+    """
+
+    ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = None       # index just after the opening quote of the value
+        self.done = False
+
+    def feed(self, text: str) -> str:
+        self.buffer += text
+        if self.done:
+            return ""
+
+        if self.pos is None:
+            match = re.search(r'"answer"\s*:\s*"', self.buffer)
+            if not match:
+                return ""
+            self.pos = match.end()
+
+        out = []
+        i = self.pos
+        while i < len(self.buffer):
+            ch = self.buffer[i]
+
+            if ch == '"':
+                self.done = True
+                i += 1
+                break
+
+            if ch == "\\":
+                if i + 1 >= len(self.buffer):
+                    break                     # wait for the escaped char
+                nxt = self.buffer[i + 1]
+                if nxt == "u":
+                    if i + 6 > len(self.buffer):
+                        break
+                    out.append(chr(int(self.buffer[i + 2:i + 6], 16)))
+                    i += 6
+                    continue
+                out.append(self.ESCAPES.get(nxt, nxt))
+                i += 2
+                continue
+
+            out.append(ch)
+            i += 1
+
+        self.pos = i
+        return "".join(out)
+
+
 # ===============================
 # FINAL ORCHESTRATION
 # ===============================
-def answer_query(query: str) -> RAGAnswer:
+def answer_query(query: str, session_id: Optional[str] = None) -> RAGAnswer:
     """
-    1. Try RAG
-    2. If RAG says 'I don't know' → fallback to general LLM
+    1. Route on retrieval relevance (see query_router)
+    2. Low relevance → general LLM directly
+    3. Otherwise try RAG; if RAG says 'I don't know' → fallback to general LLM
     """
     print('anser query')
 
+    # ---------- ANSWER CACHE ----------
+    cache_enabled = use_answer_cache(session_id)
+    if cache_enabled:
+        cached = answer_cache.get(query)
+        if cached is not None:
+            record_cached_turn(query, session_id, cached)
+            return cached
+
     # ---------- RETRIEVE ----------
-    docs = retriver(query)
+    scored_docs = retriver_with_scores(query)
+    docs = [doc for doc, _ in scored_docs]
+    scores = [score for _, score in scored_docs]
 
     print("retrived documents")
 
+    # ---------- ROUTE ----------
+    route = choose_route(scores)
+
     # ---------- RAG MODE ----------
-    if docs:
+    if docs and route != ROUTE_GENERAL:
         print("if docs available")
-        context = build_context(docs)
+        context = rag_context(query, docs)
 
         """ prompt = rag_prompt.format(
             context=context,
@@ -166,26 +342,9 @@ def answer_query(query: str) -> RAGAnswer:
 
         raw = llm.invoke(prompt) """
 
-        rag_chain = rag_prompt | llm
-
-        chat_with_memory = RunnableWithMessageHistory(
-            rag_chain,
-            get_session_history,
-            input_messages_key="question",
-            history_messages_key="history"
-        )
-
-        raw = chat_with_memory.invoke(
-            {
-                "context": context,
-                "question": query,
-                "format_instructions": output_parser.get_format_instructions()
-            },
-            config={
-                "configurable": {
-                "session_id": "default"
-            }
-            }
+        raw = rag_chat(session_id).invoke(
+            rag_inputs(context, query),
+            config=session_config(session_id)
         )
 
 
@@ -202,6 +361,9 @@ def answer_query(query: str) -> RAGAnswer:
 
             if parsed['answer'].lower().strip() != "i don't know":
                 parsed['pages'] = extract_pages(docs)
+                record_rag_outcome(scores, answered=True)
+                if cache_enabled:
+                    answer_cache.put(query, parsed)
                 return parsed
 
         except Exception as e:
@@ -224,19 +386,109 @@ def answer_query(query: str) -> RAGAnswer:
                 parsed.pages = extract_pages(docs)
                 return parsed """
 
+        record_rag_outcome(scores, answered=False)
+
     # ---------- GENERAL FALLBACK ----------
-    raw = llm.invoke(
+    raw = get_llm().invoke(
         general_prompt.format(question=query)
     )
 
     print("general raw",raw)
 
 
-    return RAGAnswer(
+    result = RAGAnswer(
         answer=raw.content.strip(),
         pages=None
     )
 
+    if cache_enabled:
+        answer_cache.put(query, result.model_dump())
+
+    return result
+
+
+# ===============================
+# STREAMING ORCHESTRATION
+# ===============================
+def stream_answer_query(query: str, session_id: Optional[str] = None):
+    """
+    Streaming variant of answer_query. Yields (event, data):
+    - ("pages", [page numbers])  as soon as retrieval is done
+    - ("token", "text")          answer text as the LLM produces it
+    - ("fallback", None)         RAG had no answer; general tokens follow
+    - ("final", RAGAnswer dict)  same structure answer_query returns
+    """
+    print('stream answer query')
+
+    # ---------- ANSWER CACHE ----------
+    cache_enabled = use_answer_cache(session_id)
+    if cache_enabled:
+        cached = answer_cache.get(query)
+        if cached is not None:
+            record_cached_turn(query, session_id, cached)
+            yield "pages", cached.get("pages") or []
+            yield "token", cached["answer"]
+            yield "final", cached
+            return
+
+    # ---------- RETRIEVE ----------
+    scored_docs = retriver_with_scores(query)
+    docs = [doc for doc, _ in scored_docs]
+    scores = [score for _, score in scored_docs]
+
+    route = choose_route(scores)
+    pages = extract_pages(docs) if route != ROUTE_GENERAL else []
+    yield "pages", pages
+
+    # ---------- RAG MODE ----------
+    if docs and route != ROUTE_GENERAL:
+        context = rag_context(query, docs)
+        streamer = AnswerFieldStreamer()
+
+        for chunk in rag_chat(session_id).stream(
+            rag_inputs(context, query),
+            config=session_config(session_id)
+        ):
+            visible = streamer.feed(chunk.content or "")
+            if visible:
+                yield "token", visible
+
+        raw_text = streamer.buffer.strip()
+
+        try:
+            parsed = output_parser.parse(raw_text)
+
+            if parsed['answer'].lower().strip() != "i don't know":
+                parsed['pages'] = pages
+                record_rag_outcome(scores, answered=True)
+                if cache_enabled:
+                    answer_cache.put(query, parsed)
+                yield "final", parsed
+                return
+
+        except Exception as e:
+            print("⚠️ Parsing failed:", e)
+
+        record_rag_outcome(scores, answered=False)
+        yield "fallback", None
+
+    # ---------- GENERAL FALLBACK ----------
+    parts = []
+    for chunk in get_llm().stream(general_prompt.format(question=query)):
+        if chunk.content:
+            parts.append(chunk.content)
+            yield "token", chunk.content
+
+    result = RAGAnswer(
+        answer="".join(parts).strip(),
+        pages=None
+    ).model_dump()
+
+    if cache_enabled:
+        answer_cache.put(query, result)
+
+    yield "final", result
+
 
 # ===============================
 # USAGE
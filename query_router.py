@@ -0,0 +1,99 @@
+"""
+Relevance-gated routing for answer_query
+Decides up front, from retrieval scores, whether a query goes straight
+to RAG, straight to the general LLM, or (in between) tries RAG with the
+general fallback.
+Scores are cosine similarities (see HybridRetriever.invoke_with_scores);
+exact evidence (page lookup, numeric or strong BM25 hit) scores 1.0 and
+so always routes to RAG.
+"""
+
+import os
+import threading
+from collections import Counter, deque
+from typing import List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ================= CONFIG =================
+# cosine thresholds; with Chroma's default relevance (1 - squared L2 / √2)
+# these correspond to roughly 0.05 and 0.3
+GENERAL_BELOW = float(os.getenv("ROUTE_GENERAL_BELOW", "0.33"))  # top score < this → general
+RAG_ABOVE = float(os.getenv("ROUTE_RAG_ABOVE", "0.5"))           # top score ≥ this → rag
+SAMPLES_TO_KEEP = 1000
+
+ROUTE_RAG = "rag"
+ROUTE_GENERAL = "general"
+ROUTE_AMBIGUOUS = "ambiguous"
+
+
+# ================= STATE =================
+_counts = Counter()
+# (top score, "answered" | "fallback") for every query that ran RAG
+_samples = deque(maxlen=SAMPLES_TO_KEEP)
+_lock = threading.Lock()
+
+
+# ================= PUBLIC API =================
+def choose_route(scores: List[float]) -> str:
+    top = max(scores, default=0.0)
+
+    if top >= RAG_ABOVE:
+        route = ROUTE_RAG
+    elif top < GENERAL_BELOW:
+        route = ROUTE_GENERAL
+    else:
+        route = ROUTE_AMBIGUOUS
+
+    with _lock:
+        _counts[route] += 1
+
+    print(f"🧭 route={route} top_score={top:.3f}")
+    return route
+
+
+def record_rag_outcome(scores: List[float], answered: bool):
+    """Call after a RAG attempt; feeds the counters and calibration samples."""
+    top = max(scores, default=0.0)
+
+    with _lock:
+        _counts["rag_answered" if answered else "rag_fallback"] += 1
+        _samples.append((top, "answered" if answered else "fallback"))
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+def calibrate() -> dict:
+    """
+    Suggested thresholds from observed RAG outcomes:
+    - general_below: 5th percentile of scores that RAG could answer
+    - rag_above: 95th percentile of scores where RAG fell back
+    """
+    with _lock:
+        answered = [score for score, outcome in _samples if outcome == "answered"]
+        fallback = [score for score, outcome in _samples if outcome == "fallback"]
+
+    return {
+        "samples": len(answered) + len(fallback),
+        "suggested_general_below": _percentile(answered, 0.05),
+        "suggested_rag_above": _percentile(fallback, 0.95),
+    }
+
+
+def route_stats() -> dict:
+    with _lock:
+        counts = dict(_counts)
+
+    return {
+        "counts": counts,
+        "general_below": GENERAL_BELOW,
+        "rag_above": RAG_ABOVE,
+        "calibration": calibrate(),
+    }
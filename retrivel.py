@@ -1,17 +1,70 @@
+import os
 import re
-from typing import List
+from typing import List, Tuple
 from langchain_core.documents import Document
-from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
+from model_registry import get_vectorstore, get_lexical_index
+from lexical_index import extract_unit_values, UNITS
 
 from dotenv import load_dotenv
 
 load_dotenv()
 
 # ================= EMBEDDINGS =================
-embeddings = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2"
+# loaded lazily through model_registry (shared with ingestion)
+CHROMA_DIR = "./chroma_store"
+
+# ================= FUSION CONFIG =================
+RRF_K = 60
+VECTOR_WEIGHT = float(os.getenv("RETRIEVAL_VECTOR_WEIGHT", "1.0"))
+LEXICAL_WEIGHT = float(os.getenv("RETRIEVAL_LEXICAL_WEIGHT", "1.0"))
+NUMERIC_WEIGHT = float(os.getenv("RETRIEVAL_NUMERIC_WEIGHT", "1.0"))
+
+# ================= SCORING CONFIG =================
+# BM25 hit whose idf-weighted query-term coverage reaches this is treated
+# as exact evidence (like a numeric hit or page lookup) → score 1.0
+LEXICAL_STRONG_COVERAGE = float(os.getenv("RETRIEVAL_LEXICAL_STRONG_COVERAGE", "0.9"))
+EVIDENCE_SCORE = 1.0
+
+# ================= PAGE LOOKUP =================
+# "page 211", "p. 12", "pages 10-12", "pp. 10 to 12", "pages 3, 5 and 8"
+# ("p"/"pp" need the period so "p 12" / "pp 10" in part numbers do not match)
+# a number followed by a unit ("pages 3 and 5 mm") is a value, not a page
+NOT_A_VALUE = r"(?![.,]?\d)(?!\s?(?:" + UNITS + r")\b)"
+PAGE_REFERENCE = re.compile(
+    r"\b(?:pages?\b|pp?\.)\s*(\d+)" + NOT_A_VALUE
+    + r"(?:\s*(?:-|–|to|through)\s*(\d+)" + NOT_A_VALUE + r")?"
+    + r"((?:\s*(?:,|and|&)\s*\d+" + NOT_A_VALUE + r")*)",
+    re.IGNORECASE,
 )
+MAX_PAGE_SPAN = 20          # pages looked up per question
+MAX_RANGE_PAGES = 1000      # "pages 1-99999" guard when expanding a range
+PAGE_LOOKUP_MAX_CHUNKS = int(os.getenv("PAGE_LOOKUP_MAX_CHUNKS", "80"))
+
+
+def referenced_pages(query: str) -> List[int]:
+    """All page numbers referenced in the query, in order, deduplicated (uncapped)."""
+    pages = []
+
+    for match in PAGE_REFERENCE.finditer(query):
+        start = int(match.group(1))
+        end = int(match.group(2)) if match.group(2) else start
+        if end < start:
+            start, end = end, start
+
+        found = list(range(start, min(end, start + MAX_RANGE_PAGES - 1) + 1))
+        found += [int(n) for n in re.findall(r"\d+", match.group(3) or "")]
+
+        for page in found:
+            if page not in pages:
+                pages.append(page)
+
+    return pages
+
+
+def extract_page_numbers(query: str) -> List[int]:
+    """The first MAX_PAGE_SPAN pages referenced in the query (what a lookup fetches)."""
+    return referenced_pages(query)[:MAX_PAGE_SPAN]
+
 
 """ embeddings = OllamaEmbeddings(
     model="nomic-embed-text"
@@ -22,38 +75,145 @@ embeddings = HuggingFaceEmbeddings(
 ) """
 
 
-vectorstore = Chroma(
-    persist_directory="./chroma_store",
-    embedding_function=embeddings
-)
-
-
 # ================= HYBRID RETRIEVER =================
 class HybridRetriever:
     def __init__(
         self,
-        vectorstore,
+        vectorstore=None,
         k: int = 4,
         fetch_k: int = 20,
-        lambda_mult: float = 0.4
+        lambda_mult: float = 0.4,
+        lexical_index=None,
+        vector_weight: float = VECTOR_WEIGHT,
+        lexical_weight: float = LEXICAL_WEIGHT,
+        numeric_weight: float = NUMERIC_WEIGHT,
+        rrf_k: int = RRF_K,
     ):
-        self.vectorstore = vectorstore
+        self._vectorstore = vectorstore
+        self._lexical_index = lexical_index
         self.k = k
         self.fetch_k = fetch_k
         self.lambda_mult = lambda_mult
+        self.vector_weight = vector_weight
+        self.lexical_weight = lexical_weight
+        self.numeric_weight = numeric_weight
+        self.rrf_k = rrf_k
 
-    def _extract_exact_terms(self, query: str) -> List[str]:
+    @property
+    def vectorstore(self):
+        # resolved on first query → importing this module stays cheap
+        if self._vectorstore is None:
+            self._vectorstore = get_vectorstore(CHROMA_DIR)
+        return self._vectorstore
+
+    @property
+    def lexical_index(self):
+        if self._lexical_index is None:
+            self._lexical_index = get_lexical_index(CHROMA_DIR)
+        return self._lexical_index
+
+    @staticmethod
+    def _doc_key(doc: Document) -> str:
+        return getattr(doc, "id", None) or doc.page_content
+
+    def _load_by_ids(self, ids: List[str]) -> List[Document]:
+        """Fetch stored chunks from Chroma, keeping the order of ids."""
+        if not ids:
+            return []
+
+        stored = self.vectorstore.get(ids=ids, include=["documents", "metadatas"])
+        by_id = {
+            doc_id: Document(id=doc_id, page_content=text, metadata=meta or {})
+            for doc_id, text, meta in zip(stored["ids"], stored["documents"], stored["metadatas"])
+        }
+
+        return [by_id[doc_id] for doc_id in ids if doc_id in by_id]
+
+    def _page_lookup(self, pages: List[int], max_chunks: int = PAGE_LOOKUP_MAX_CHUNKS) -> List[Document]:
+        """
+        Chunks of the given pages via metadata filter, no embedding / ANN.
+        Whole pages are taken in requested order while they fit max_chunks
+        (the first page is always returned, cut to max_chunks).
         """
-        Extract numeric + unit phrases exactly as they appear in text
+        stored = self.vectorstore.get(
+            where={"page": {"$in": pages}},
+            include=["documents", "metadatas"],
+        )
+        docs = [
+            Document(id=doc_id, page_content=text, metadata=meta or {})
+            for doc_id, text, meta in zip(stored["ids"], stored["documents"], stored["metadatas"])
+        ]
+
+        # requested page order, then reading order within the page
+        docs.sort(key=lambda d: (pages.index(d.metadata.get("page")), d.metadata.get("chunk", 0)))
+
+        by_page = {}
+        for doc in docs:
+            by_page.setdefault(doc.metadata.get("page"), []).append(doc)
+
+        kept = []
+        for page_docs in by_page.values():
+            if kept and len(kept) + len(page_docs) > max_chunks:
+                break
+            kept.extend(page_docs[:max_chunks])
+
+        if len(kept) < len(docs):
+            print(f"📄 page lookup capped at {len(kept)}/{len(docs)} chunks")
+        return kept
+
+    def _lexical_search(self, query: str) -> Tuple[List[Document], set]:
+        """BM25 hits best first, plus the keys of hits covering the query (strong hits)."""
+        hits = self.lexical_index.search_with_coverage(query, k=self.fetch_k)
+        strong = {doc_id for doc_id, _, coverage in hits if coverage >= LEXICAL_STRONG_COVERAGE}
+        return self._load_by_ids([doc_id for doc_id, _, _ in hits]), strong
+
+    def _numeric_search(self, exact_terms: List[Tuple[str, str]]) -> List[Document]:
+        """Chunks containing the exact (value, unit) pairs, straight from the inverted index."""
+        ids = self.lexical_index.lookup_unit_values(exact_terms, k=self.fetch_k)
+        return self._load_by_ids(ids)
+
+    def _fuse(self, ranked_lists) -> List[Document]:
+        """
+        Weighted reciprocal rank fusion, best first (not truncated).
+        ranked_lists: [(weight, [docs best first]), ...]
+        """
+        scores = {}
+        docs = {}
+
+        for weight, ranked in ranked_lists:
+            for rank, doc in enumerate(ranked, start=1):
+                key = self._doc_key(doc)
+                docs.setdefault(key, doc)
+                scores[key] = scores.get(key, 0.0) + weight / (self.rrf_k + rank)
+
+        best = sorted(scores, key=scores.get, reverse=True)
+        return [docs[key] for key in best]
+
+    def _extract_exact_terms(self, query: str) -> List[Tuple[str, str]]:
+        """
+        Extract numeric + unit constraints, normalized the same way as
+        at ingestion time
         Example:
-        - 5.5 mm
-        - 10 bar
-        - 200 rpm
+        - 5.5 mm / 5,5mm → ("5.5", "mm")
+        - 10 bar → ("10", "bar")
+        - 200 rpm → ("200", "rpm")
         """
-        pattern = r"\b\d+(?:\.\d+)?\s?(?:mm|cm|m|bar|rpm|kg|°c|kw|nm)\b"
-        return re.findall(pattern, query.lower())
+        return extract_unit_values(query)
+
+    def _retrieve(self, query: str) -> Tuple[List[Document], set, bool]:
+        """
+        (docs best first, keys of exact-evidence docs, page lookup?)
+        Exact evidence: every doc of a page lookup, docs containing a
+        queried value + unit, and strong BM25 hits.
+        """
+        # 0️⃣ Explicit page reference → direct metadata lookup
+        pages = extract_page_numbers(query)
+        if pages:
+            page_docs = self._page_lookup(pages)
+            if page_docs:
+                print(f"📄 page lookup {pages}: {len(page_docs)} chunks")
+                return page_docs, {self._doc_key(doc) for doc in page_docs}, True
 
-    def invoke(self, query: str) -> List[Document]:
         # 1️⃣ Semantic retrieval (MMR)
         semantic_docs = self.vectorstore.max_marginal_relevance_search(
             query=query,
@@ -62,33 +222,72 @@ class HybridRetriever:
             lambda_mult=self.lambda_mult,
         )
 
-        # 2️⃣ Extract numeric constraints
+        # 2️⃣ Lexical retrieval (BM25)
+        lexical_docs, evidence = self._lexical_search(query)
+
+        # 3️⃣ Extract numeric constraints → direct inverted-index lookup
         exact_terms = self._extract_exact_terms(query)
+        numeric_docs = self._numeric_search(exact_terms) if exact_terms else []
 
-        if not exact_terms:
-            return semantic_docs
+        # 4️⃣ Fuse all rankings
+        candidates = self._fuse([
+            (self.vector_weight, semantic_docs),
+            (self.lexical_weight, lexical_docs),
+            (self.numeric_weight, numeric_docs),
+        ])
 
-        # 3️⃣ Prefer documents containing numeric constraints
-        strong_matches = []
-        weak_matches = []
+        if not exact_terms:
+            return candidates[:self.k], evidence, False
 
-        for doc in semantic_docs:
-            text = doc.page_content.lower()
-            if any(term in text for term in exact_terms):
-                strong_matches.append(doc)
-            else:
-                weak_matches.append(doc)
+        # 5️⃣ Prefer documents containing numeric constraints
+        strong_matches = [
+            doc for doc in candidates
+            if set(exact_terms) & set(extract_unit_values(doc.page_content))
+        ]
+        evidence |= {self._doc_key(doc) for doc in strong_matches}
 
-        # 4️⃣ Return strong matches first, fallback if needed
+        # 6️⃣ Return strong matches first, fallback if needed
         if strong_matches:
-            return strong_matches
+            return strong_matches[:self.k], evidence, False
 
-        return semantic_docs
+        return candidates[:self.k], evidence, False
+
+    def invoke(self, query: str) -> List[Document]:
+        docs, _, _ = self._retrieve(query)
+        return docs
+
+    def _cosine_scores(self, query: str) -> dict:
+        """
+        {doc key: cosine similarity} for the top fetch_k vector hits.
+        Chroma returns distances in its collection space ("l2" = squared
+        L2 by default); for unit-normalized embeddings that is 2 - 2·cos.
+        """
+        collection = getattr(self.vectorstore, "_collection", None)
+        space = ((getattr(collection, "metadata", None) or {}).get("hnsw:space") or "l2")
+
+        scores = {}
+        for doc, distance in self.vectorstore.similarity_search_with_score(query, k=self.fetch_k):
+            cosine = 1.0 - distance / 2.0 if space == "l2" else 1.0 - distance
+            scores[self._doc_key(doc)] = min(max(cosine, 0.0), 1.0)
+        return scores
+
+    def invoke_with_scores(self, query: str) -> List[Tuple[Document, float]]:
+        """
+        invoke() plus a score in [0, 1] per document: the cosine similarity
+        to the query, or 1.0 for exact evidence (page lookup, numeric hit,
+        strong BM25 hit). Other lexical-only docs score 0.0.
+        """
+        docs, evidence, page_lookup = self._retrieve(query)
+        cosine = {} if page_lookup else self._cosine_scores(query)
+
+        return [
+            (doc, EVIDENCE_SCORE if self._doc_key(doc) in evidence else cosine.get(self._doc_key(doc), 0.0))
+            for doc in docs
+        ]
 
 
 # ================= PUBLIC RETRIEVER =================
 retriever = HybridRetriever(
-    vectorstore=vectorstore,
     k=4,
     fetch_k=20,
     lambda_mult=0.5
@@ -106,3 +305,12 @@ def retriver(query: str) -> List[Document]:
         print(d.page_content[:500]) """
 
     return docs
+
+
+def retriver_with_scores(query: str) -> List[Tuple[Document, float]]:
+
+    print("retriver with scores")
+    scored_docs = retriever.invoke_with_scores(query)
+    print("retrived scores", [round(score, 3) for _, score in scored_docs])
+
+    return scored_docs
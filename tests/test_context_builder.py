@@ -0,0 +1,51 @@
+"""
+Context handed to the LLM stays within its token budget and says so when
+it had to leave requested text out.
+"""
+
+from langchain_core.documents import Document
+
+import context_builder
+from context_builder import build_page_context, estimate_tokens
+
+
+def page_chunk(page: int, chars: int = 2000) -> Document:
+    return Document(page_content="x" * chars, metadata={"page": page})
+
+
+def test_page_context_within_budget_is_verbatim():
+    docs = [page_chunk(1), page_chunk(2)]
+    context = build_page_context(docs, [1, 2], token_budget=3000)
+    assert "Note:" not in context
+    assert context.count("x") == 4000
+
+
+def test_page_context_over_budget_is_truncated_with_note():
+    docs = [page_chunk(p) for p in range(1, 11)]
+    context = build_page_context(docs, list(range(1, 41)), token_budget=1200)
+    assert estimate_tokens(context) < 1200 + 200
+    assert "page 3 is cut off" in context
+    assert "pages not included: 4, 5" in context
+    assert "40" in context
+
+
+class KeywordEmbeddings:
+    """Scores a text by whether it mentions "pump"; enough to rank sentences."""
+
+    def embed_query(self, text):
+        return [1.0, 0.0]
+
+    def embed_documents(self, texts):
+        return [[1.0, 0.0] if "pump" in t else [0.0, 1.0] for t in texts]
+
+
+def test_compressed_context_never_empty(monkeypatch):
+    monkeypatch.setattr(context_builder, "get_embeddings", lambda: KeywordEmbeddings())
+    docs = [Document(
+        page_content="filler " * 200 + ". the pump " + "word " * 300,
+        metadata={"page": 7},
+    )]
+    context = context_builder.build_compressed_context("pump", docs, token_budget=50)
+    assert context.startswith("(Page 7) ")
+    assert "pump" in context
+    assert estimate_tokens(context) <= 50 + 5
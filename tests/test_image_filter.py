@@ -0,0 +1,168 @@
+"""
+Regression: the header / thumbnail triage in image_filter must keep or
+drop exactly the same images as the original full-resolution check.
+"""
+
+import base64
+import random
+from io import BytesIO
+
+import pytest
+
+np = pytest.importorskip("numpy")
+PIL = pytest.importorskip("PIL")
+from PIL import Image as PILImage, ImageDraw
+
+from loadingandcleaning import image_filter
+
+
+# ================= BASELINE =================
+# the original is_useful_image, unchanged
+def baseline_is_useful_image(image_base64: str) -> bool:
+    try:
+        img_bytes = base64.b64decode(image_base64)
+        img = PILImage.open(BytesIO(img_bytes)).convert("L")
+    except Exception:
+        return False
+
+    width, height = img.size
+    area = width * height
+
+    if area < 50 * 50:
+        return False
+
+    pixels = np.array(img)
+
+    mask = pixels <= image_filter.NEAR_BLACK_MAX
+    black_pixels = np.sum(mask)
+
+    if black_pixels == 0:
+        return False
+
+    ys, xs = np.where(mask)
+    x_min, x_max = xs.min(), xs.max()
+    y_min, y_max = ys.min(), ys.max()
+
+    box_width = x_max - x_min + 1
+    box_height = y_max - y_min + 1
+    box_area = box_width * box_height
+
+    fill_ratio = black_pixels / box_area
+
+    aspect_ratio = box_width / max(box_height, 1)
+
+    if (
+        fill_ratio > 0.75 and
+        0.75 < aspect_ratio < 1.25 and
+        box_area < area * 0.8
+    ):
+        return False
+
+    return True
+
+
+# ================= IMAGES =================
+def encode(img: PILImage.Image) -> str:
+    buf = BytesIO()
+    img.save(buf, "PNG")
+    return base64.b64encode(buf.getvalue()).decode()
+
+
+def dot(size, center, radius) -> str:
+    img = PILImage.new("L", size, 255)
+    cx, cy = center
+    ImageDraw.Draw(img).ellipse([cx - radius, cy - radius, cx + radius, cy + radius], fill=0)
+    return encode(img)
+
+
+def square_with_hairline(size, side, line_y) -> str:
+    """A dense square (dropped on its own) plus a 1 px line that keeps it."""
+    w, h = size
+    img = PILImage.new("L", size, 255)
+    draw = ImageDraw.Draw(img)
+    x0, y0 = (w - side) // 2, (h - side) // 2
+    draw.rectangle([x0, y0, x0 + side, y0 + side], fill=0)
+    draw.line([(0, line_y), (w - 1, line_y)], fill=0, width=1)
+    return encode(img)
+
+
+def random_image(rng: random.Random) -> str:
+    w, h = rng.randint(10, 3000), rng.randint(10, 3000)
+    img = PILImage.new("L", (w, h), 255)
+    draw = ImageDraw.Draw(img)
+    kind = rng.random()
+
+    if kind < 0.35:
+        r = rng.randint(1, max(1, min(w, h) // 2))
+        cx, cy = rng.randint(0, w), rng.randint(0, h)
+        draw.ellipse([cx - r, cy - r, cx + r, cy + r], fill=0)
+    elif kind < 0.6:
+        for _ in range(rng.randint(1, 20)):
+            draw.line(
+                [rng.randint(0, w), rng.randint(0, h), rng.randint(0, w), rng.randint(0, h)],
+                fill=rng.randint(0, 60),
+                width=rng.randint(1, 4),
+            )
+    elif kind < 0.85:
+        x0, y0 = rng.randint(0, w), rng.randint(0, h)
+        draw.rectangle(
+            [x0, y0, x0 + rng.randint(0, w // 3 + 1), y0 + rng.randint(0, h // 3 + 1)],
+            fill=rng.randint(0, 45),
+        )
+    else:
+        for _ in range(rng.randint(1, 30)):
+            x, y, r = rng.randint(0, w), rng.randint(0, h), rng.randint(0, 6)
+            draw.ellipse([x - r, y - r, x + r, y + r], fill=0)
+
+    return encode(img)
+
+
+# ================= TESTS =================
+@pytest.mark.parametrize("center", [(1500, 1500), (1507, 1493), (40, 2960), (2211, 733)])
+def test_small_dot_on_large_page_matches_baseline(center):
+    payload = dot((3000, 3000), center, 15)
+    assert image_filter.is_useful_image(payload) == baseline_is_useful_image(payload)
+
+
+@pytest.mark.parametrize("size, side, line_y", [
+    ((2000, 1500), 300, 1201),
+    ((1024, 1024), 200, 901),
+    ((3000, 3000), 300, 2901),
+])
+def test_square_with_hairline_matches_baseline(size, side, line_y):
+    payload = square_with_hairline(size, side, line_y)
+    assert baseline_is_useful_image(payload)
+    assert image_filter.is_useful_image(payload)
+
+
+def test_random_images_match_baseline():
+    rng = random.Random(1)
+    payloads = [random_image(rng) for _ in range(300)]
+
+    mismatches = [
+        i for i, payload in enumerate(payloads)
+        if image_filter.is_useful_image(payload) != baseline_is_useful_image(payload)
+    ]
+    assert mismatches == []
+
+
+def test_filter_images_per_page_matches_baseline():
+    rng = random.Random(2)
+    payloads = [random_image(rng) for _ in range(40)] + ["not an image"]
+
+    class Metadata:
+        def __init__(self, payload):
+            self.image_base64 = payload
+
+    class Element:
+        category = "Image"
+
+        def __init__(self, payload):
+            self.metadata = Metadata(payload)
+
+    elements = [Element(p) for p in payloads]
+    kept = image_filter.filter_images_per_page({1: list(elements)}, workers=1)[1]
+
+    assert [el.metadata.image_base64 for el in kept] == [
+        p for p in payloads if baseline_is_useful_image(p)
+    ]
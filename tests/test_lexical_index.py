@@ -0,0 +1,33 @@
+"""
+Coverage from LexicalIndex.search_with_coverage decides whether a BM25
+hit counts as exact evidence for routing (see retrivel.HybridRetriever).
+"""
+
+from lexical_index import LexicalIndex
+from retrivel import LEXICAL_STRONG_COVERAGE
+
+
+def manual_index() -> LexicalIndex:
+    index = LexicalIndex(":memory:")
+    index.upsert([
+        ("c1", "Who is responsible for the maintenance of the pump? The operator is."),
+        ("c2", "Tighten the cylinder head bolts to 45 nm in two passes."),
+        ("c3", "The oil filter is replaced every 500 hours of operation."),
+    ])
+    return index
+
+
+def test_off_topic_query_is_not_evidence():
+    hits = manual_index().search_with_coverage("who is the president of France")
+    assert all(coverage < LEXICAL_STRONG_COVERAGE for _, _, coverage in hits)
+
+
+def test_on_topic_query_is_evidence():
+    hits = manual_index().search_with_coverage("when is the oil filter replaced")
+    doc_id, _, coverage = hits[0]
+    assert doc_id == "c3"
+    assert coverage >= LEXICAL_STRONG_COVERAGE
+
+
+def test_search_ranks_without_coverage():
+    assert manual_index().search("cylinder head bolts")[0][0] == "c2"